@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from benchmark import best_time, INGREDIENT_QUERIES, TITLE_QUERIES
+from compact import bytes_per_row
+from corpus import build_corpus, get_corpus, load_corpus, COMPILED_CORPUS_FILE
+from deltas import append_recipes, compact
+from export import EXPORT_FORMATS
+from ingredient_index import parse_ingredient_terms
+from neighbors import top_k_arrays, DEFAULT_K, BLOCK_SIZE
+from query import plan_search
+from search_engine import SearchEngine, SearchQuery
+from synthetic import generate_sources
+
+DEFAULT_SIZES = [10_000, 100_000]
+RESULTS_DIR = 'bench-results'
+PAGE_SIZE = 25
+# Spoonacular rows appended for the incremental measurements: half updates, half new recipes
+APPEND_ROWS = 100
+
+# One search per filter type, as plan_search keyword arguments
+FILTER_CASES = {
+    'meal': {'meal_search': 'chicken'},
+    'meal_fuzzy': {'meal_search': 'chiken curyy'},
+    'category': {'category_search': 'Dessert'},
+    'area': {'area_search': 'Italian'},
+    'tags': {'tags_search': 'Soup Easy'},
+    'ingredients': {'ingredients_search': 'garlic onion'},
+    'vegetarian': {'vegetarian_filter': True},
+    'kosher': {'kosher_filter': True},
+    'num_ingredients': {'num_ingredients': 'Fewer (0-5)'},
+    'ready_in': {'ranges': (('ready_in_minutes', None, 30),)},
+    'price_range': {'ranges': (('price_per_serving', 1, 3),)},
+    'vegan': {'diets': ('is_vegan',)},
+    'combined': {'meal_search': 'chicken', 'ingredients_search': 'garlic', 'num_ingredients': 'Moderate (0-10)'},
+    'ready_in_combined': {'ingredients_search': 'garlic', 'ranges': (('ready_in_minutes', None, 30),)},
+}
+# End-to-end engine searches: plan, ratings join, star filter, sort and one page of details
+ENGINE_CASES = {
+    'min_star_rating': SearchQuery(min_star_rating='★★★☆☆'),
+    'top_rated_page': SearchQuery(ingredients_search='garlic', sort_by='Top Rated'),
+    'pantry_coverage': SearchQuery(pantry_search='eggs, flour, milk, butter, sugar, salt, olive oil, garlic, onion, '
+                                                 'tomato, chicken, rice', sort_by='Pantry Coverage'),
+    'under_30_minutes': SearchQuery(ranges=(('ready_in_minutes', None, 30),), diets=('is_dairy_free',)),
+}
+
+
+def git_revision(base_dir):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=base_dir, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=base_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 3)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if platform.system() == 'Darwin' else 1 << 10), 1)
+
+
+def rss_mb():
+    """Current resident set size, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1 << 20)
+    except OSError:
+        return None
+
+
+def peak_memory_growth(func, interval=0.002):
+    """(func(), {'rss_mb', 'arrow_mb'}): how far the resident set and Arrow's allocations peaked above
+    their starting sizes while func ran. RSS also counts memory the allocators keep after a free.
+    """
+    baseline = {'rss_mb': rss_mb(), 'arrow_mb': pa.total_allocated_bytes() / (1 << 20)}
+    peak = dict(baseline)
+    done = threading.Event()
+
+    def sample():
+        while True:
+            current = {'rss_mb': rss_mb(), 'arrow_mb': pa.total_allocated_bytes() / (1 << 20)}
+            for name, value in current.items():
+                if value is not None:
+                    peak[name] = max(peak[name], value)
+            if done.wait(interval):
+                break
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = func()
+    finally:
+        done.set()
+        sampler.join()
+    return result, {name: None if value is None else round(peak[name] - value, 1) for name, value in baseline.items()}
+
+
+def search_first_page(engine, query):
+    found = engine.search(query)
+    found.page(0, PAGE_SIZE)
+    return found.total
+
+
+def run_size(base_dir, data_dir, rows, seed=0, workers=None):
+    """Every measurement of the suite for one synthetic corpus of `rows` rows."""
+    result = {'rows': rows, 'seed': seed}
+    start = time.perf_counter()
+    result['source_rows'] = generate_sources(base_dir, data_dir, rows, seed)
+    result['generate_s'] = round(time.perf_counter() - start, 3)
+
+    # Ingest and normalization, stage by stage (the all-pairs neighbor table is left out:
+    # it grows quadratically; its throughput is sampled below instead)
+    start = time.perf_counter()
+    metadata = build_corpus(data_dir, workers=workers, neighbors=False)
+    result['build_s'] = round(time.perf_counter() - start, 3)
+    result['build_stages_ms'] = {name: milliseconds(seconds) for name, seconds in metadata['timings'].items()}
+
+    # Cold load: read the search tier and build every in-memory index
+    start = time.perf_counter()
+    corpus = get_corpus(data_dir)
+    result['cold_load_ms'] = milliseconds(time.perf_counter() - start)
+    read_time, _ = best_time(lambda: load_corpus(data_dir))
+    result['read_search_tier_ms'] = milliseconds(read_time)
+    df = corpus.combined_df
+
+    result['filters'] = {}
+    for name, kwargs in FILTER_CASES.items():
+        elapsed, positions = best_time(lambda: plan_search(df, corpus.ingredient_index, title_index=corpus.title_index,
+                                                           live=corpus.live, numeric_indexes=corpus.numeric_indexes,
+                                                           **kwargs).execute())
+        result['filters'][name] = {'ms': milliseconds(elapsed), 'matches': len(positions)}
+
+    engine = SearchEngine(data_dir)
+    result['engine'] = {}
+    for name, query in ENGINE_CASES.items():
+        # The first page without the result cache, then the search alone without and with it
+        elapsed, total = best_time(lambda: (engine.result_cache.clear(), search_first_page(engine, query))[1])
+        result['engine'][name] = {'ms': milliseconds(elapsed), 'matches': total}
+        elapsed, found = best_time(lambda: (engine.result_cache.clear(), engine.search(query))[1])
+        result['engine'][f'{name}_search'] = {'ms': milliseconds(elapsed), 'matches': found.total}
+        elapsed, found = best_time(lambda: engine.search(query))
+        result['engine'][f'{name}_search_cached'] = {'ms': milliseconds(elapsed), 'matches': found.total}
+    # Counts for every category, region and dietary option, as drawn on each rerun
+    for name, query in [('facet_counts', SearchQuery()), ('facet_counts_filtered', SearchQuery(**FILTER_CASES['combined']))]:
+        elapsed, counts = best_time(lambda: engine.facet_counts(query))
+        result['engine'][name] = {'ms': milliseconds(elapsed), 'matches': counts['total']}
+
+    # Streaming export of a broad search (nearly every row) in each format; peak memory
+    # should follow the batch size, not the number of rows
+    result['export'] = {}
+    export_result = engine.search(SearchQuery(num_ingredients='More (0-100)'))
+    with tempfile.TemporaryDirectory() as export_dir:
+        # Warm up first, so opening the detail tier does not count towards the first format
+        export_result.export(os.path.join(export_dir, 'warm-up.jsonl'), 'jsonl', batch_size=PAGE_SIZE)
+        for export_format in EXPORT_FORMATS:
+            path = os.path.join(export_dir, f'export.{export_format}')
+            stats, growth = peak_memory_growth(lambda: export_result.export(path, export_format))
+            result['export'][export_format] = {
+                'rows_per_s': round(stats['rows_per_second'], 1),
+                'file_bytes': stats['bytes'],
+                'peak_rss_growth_mb': growth['rss_mb'],
+                'peak_arrow_mb': growth['arrow_mb'],
+                'matches': stats['rows'],
+            }
+
+    result['ingredient_search'] = {}
+    for query in INGREDIENT_QUERIES:
+        terms = parse_ingredient_terms(query)
+        elapsed, matches = best_time(lambda: corpus.ingredient_index.search(terms))
+        result['ingredient_search'][query] = {'ms': milliseconds(elapsed), 'matches': len(matches)}
+
+    result['title_search'] = {}
+    for query in TITLE_QUERIES:
+        elapsed, matches = best_time(lambda: corpus.title_index.search(query))
+        result['title_search'][query] = {'ms': milliseconds(elapsed), 'matches': len(matches)}
+
+    # Similar items for one results page, and the neighbor-table build rate from one block
+    rng = np.random.default_rng(seed)
+    labels = df.index[rng.integers(0, len(df), size=PAGE_SIZE)]
+    elapsed, _ = best_time(lambda: corpus.similarity_engine.top_similar(labels))
+    block = np.arange(min(BLOCK_SIZE, len(df)))
+    block_time, _ = best_time(lambda: top_k_arrays(corpus.similarity_engine, block, DEFAULT_K), repeat=1)
+    result['similarity'] = {
+        'page_lookup_ms': milliseconds(elapsed),
+        'neighbor_rows_per_s': round(len(block) / block_time, 1),
+        'neighbor_build_estimate_s': round(len(df) * block_time / len(block), 1),
+    }
+
+    result['memory'] = {
+        'search_tier_bytes_per_row': round(bytes_per_row(df), 1),
+        'ingredient_lists_bytes': int(corpus.ingredient_lists.nbytes),
+        'compiled_file_bytes': os.path.getsize(os.path.join(data_dir, COMPILED_CORPUS_FILE)),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    # Appending recipes as a delta segment, merging it into the loaded corpus on the next
+    # get_corpus, and folding it back into the base (last: it rewrites the corpus files)
+    appended = pd.read_parquet(os.path.join(data_dir, 'spoonacular.parquet')).tail(APPEND_ROWS).reset_index(drop=True)
+    new_rows = np.arange(len(appended)) % 2 == 1
+    appended.loc[new_rows, 'id'] += int(appended['id'].max()) + 1
+    start = time.perf_counter()
+    append_recipes(data_dir, 'spoonacular', appended)
+    append_time = time.perf_counter() - start
+    start = time.perf_counter()
+    get_corpus(data_dir)
+    refresh_time = time.perf_counter() - start
+    stats = compact(data_dir)
+    result['incremental'] = {
+        'rows': len(appended),
+        'append_ms': milliseconds(append_time),
+        'refresh_ms': milliseconds(refresh_time),
+        'compact_s': round(stats['seconds'], 3),
+    }
+    return result
+
+
+def run_suite(base_dir, sizes, data_dir=None, seed=0, workers=None):
+    """Run the suite at each size; synthetic corpora go to data_dir (a temporary directory by default)."""
+    report = {
+        'revision': git_revision(base_dir),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': [],
+    }
+    root = data_dir or tempfile.mkdtemp(prefix='recipes-bench-')
+    try:
+        for rows in sizes:
+            result = run_size(base_dir, os.path.join(root, str(rows)), rows, seed, workers)
+            report['results'].append(result)
+            print(f"{rows} rows: build {result['build_s']}s, cold load {result['cold_load_ms']} ms, "
+                  f"peak RSS {result['memory']['peak_rss_mb']} MB")
+    finally:
+        if data_dir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def flatten(value, prefix=''):
+    """Numeric leaves of a nested result as {'filters.meal.ms': 1.2, ...}."""
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f'{prefix}.{key}' if prefix else str(key)))
+        return items
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix: value}
+    return {}
+
+
+def compare(old_report, new_report, threshold=1.2):
+    """Print every time and size metric of two reports side by side; flag ratios above threshold."""
+    old_results = {result['rows']: flatten(result) for result in old_report['results']}
+    for result in new_report['results']:
+        old = old_results.get(result['rows'])
+        if old is None:
+            continue
+        print(f"{result['rows']} rows: {old_report['revision']} -> {new_report['revision']}")
+        for name, value in flatten(result).items():
+            # Match counts are compared too: a change there is a behavior change, not noise
+            if name not in old or name in ('rows', 'seed'):
+                continue
+            ratio = value / old[name] if old[name] else (1.0 if value == old[name] else float('inf'))
+            if name.endswith('matches'):
+                flag = '  <-- changed' if value != old[name] else ''
+            else:
+                # Everything is lower-is-better except throughput
+                worse = ratio < 1 / threshold if name.endswith('rows_per_s') else ratio > threshold
+                flag = '  <-- regression' if worse else ''
+            print(f'  {name:<48} {old[name]:>12} {value:>12} {ratio:>7.2f}x{flag}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark suite over synthetic corpora.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the suite and write a JSON report')
+    run.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES)
+    run.add_argument('--output', help=f'report path (default {RESULTS_DIR}/<revision>.json)')
+    run.add_argument('--data-dir', help='keep the synthetic corpora here instead of a temporary directory')
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--workers', type=int)
+    diff = commands.add_parser('compare', help='compare two JSON reports')
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    if args.command == 'compare':
+        with open(args.old) as old_file, open(args.new) as new_file:
+            compare(json.load(old_file), json.load(new_file), args.threshold)
+    else:
+        report = run_suite(base_dir, args.sizes, args.data_dir, args.seed, args.workers)
+        output = args.output or os.path.join(base_dir, RESULTS_DIR, f"{report['revision'] or 'unversioned'}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Wrote {output}')
@@ -0,0 +1,285 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import os
+import sys
+import time
+import asyncio
+import json
+from urllib.parse import urlencode
+from corpus import load_corpus, get_corpus, build_combined_df, COMPILED_CORPUS_FILE, SEARCH_COLUMNS
+from compact import bytes_per_row
+from facets import AREAS, FacetIndex, category_pattern, is_kosher, ingredient_count_mask, pack
+from query import plan_search
+from search_engine import get_search_engine
+from search_server import SearchServer
+from trigram import TrigramIndex
+from synthetic import synthetic_titles
+from ingredient_index import IngredientIndex, parse_ingredient_terms, ingredient_term_pattern
+from recipes_tab import read_nested_column, flatten_sections, flatten_instructions
+from utils import parse_instructions, parse_ingredients_and_measurements, extract_ingredients
+
+INGREDIENT_QUERIES = ['egg', 'chicken garlic', 'tomato onion "olive oil"', 'sugar butter flour', 'saffron']
+
+
+def best_time(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def scale_corpus(combined_df, rows):
+    """Repeat the corpus until it has `rows` rows (with a fresh RangeIndex)."""
+    repeats = -(-rows // len(combined_df))
+    return pd.concat([combined_df] * repeats, ignore_index=True).iloc[:rows]
+
+
+def regex_ingredient_search(ingredients, terms):
+    for term in terms:
+        ingredients = ingredients[ingredients.str.contains(ingredient_term_pattern(term), case=False, na=False)]
+    return ingredients.index.to_numpy()
+
+
+def bench_ingredient_search(combined_df, sizes):
+    print(f"{'rows':>10} {'build s':>9} {'query':<28} {'regex ms':>10} {'index ms':>10} {'speedup':>8}")
+    for rows in sizes:
+        ingredients = scale_corpus(combined_df, rows)['ingredients'].fillna('')
+        build_time, index = best_time(lambda: IngredientIndex(ingredients), repeat=1)
+        for query in INGREDIENT_QUERIES:
+            terms = parse_ingredient_terms(query)
+            regex_time, expected = best_time(lambda: regex_ingredient_search(ingredients, terms))
+            index_time, actual = best_time(lambda: index.search(terms))
+            if list(expected) != list(actual):
+                raise AssertionError(f'Index results differ from the regex scan for {query!r} at {rows} rows')
+            print(f'{rows:>10} {build_time:>9.2f} {query:<28} {regex_time * 1000:>10.2f} {index_time * 1000:>10.2f} '
+                  f'{regex_time / max(index_time, 1e-9):>7.1f}x')
+
+
+def bench_recipes_parsing(base_dir):
+    """Row-wise eval parsing of recipes.parquet against the native nested-column path.
+
+    Also times a copy of the table that stores `sections` and `instructions` as real
+    nested Parquet columns, where no per-row parsing is left at all.
+    """
+    table = pq.read_table(os.path.join(base_dir, 'recipes.parquet'))
+    recipes_df = table.to_pandas()
+    nested_table = table
+    for name in ['sections', 'instructions']:
+        nested_table = nested_table.set_column(nested_table.schema.get_field_index(name), name,
+                                               read_nested_column(table, name))
+
+    def legacy():
+        return (recipes_df['instructions'].apply(parse_instructions).tolist(),
+                recipes_df['sections'].apply(parse_ingredients_and_measurements).tolist(),
+                recipes_df['sections'].apply(extract_ingredients).tolist())
+
+    def native(table):
+        parsed_ingredients, search_ingredients = flatten_sections(read_nested_column(table, 'sections'))
+        return (flatten_instructions(read_nested_column(table, 'instructions')).tolist(),
+                parsed_ingredients.tolist(), search_ingredients.tolist())
+
+    legacy_time, expected = best_time(legacy)
+    print(f'recipes.parquet ({len(recipes_df)} rows): row-wise eval {legacy_time * 1000:.1f} ms')
+    for label, source in [('string columns', table), ('nested columns', nested_table)]:
+        native_time, actual = best_time(lambda: native(source))
+        if expected != actual:
+            raise AssertionError(f'Native parsing of {label} differs from the row-wise parsers')
+        print(f'  native, {label}: {native_time * 1000:.1f} ms ({legacy_time / max(native_time, 1e-9):.1f}x)')
+
+def bench_corpus_tiers(base_dir, page_size=25):
+    """Load time and memory of the search tier against the whole compiled corpus, and per-page detail reads."""
+    path = os.path.join(base_dir, COMPILED_CORPUS_FILE)
+    for label, columns in [('all columns', None), ('search tier', SEARCH_COLUMNS)]:
+        load_time, df = best_time(lambda: pd.read_parquet(path, columns=columns))
+        print(f'{label:<12} load {load_time * 1000:>7.1f} ms, {df.memory_usage(deep=True).sum() / 1e6:>6.2f} MB')
+    corpus = get_corpus(base_dir)
+    page = corpus.combined_df.sample(min(page_size, len(corpus.combined_df)), random_state=0)
+    fetch_time, _ = best_time(lambda: corpus.with_details(page))
+    print(f'detail tier  {len(page)} rows in {fetch_time * 1000:.1f} ms')
+
+
+def bench_memory(base_dir):
+    """Resident bytes per recipe: the old wide frame, the corpus columns as plain strings, the compact corpus."""
+    wide_df = build_combined_df(base_dir, workers=1)
+    plain_df = load_corpus(base_dir, columns=None)
+    plain_df = plain_df.astype({column: str for column in plain_df.select_dtypes('category').columns})
+    corpus = get_corpus(base_dir)
+    for label, size in [
+        (f'wide combined frame ({wide_df.shape[1]} columns)', bytes_per_row(wide_df)),
+        ('corpus columns, plain strings', bytes_per_row(plain_df)),
+        ('search tier + interned ingredient ids', bytes_per_row(corpus.combined_df, corpus.ingredient_lists)),
+    ]:
+        print(f'{label:<40} {size:>9.0f} bytes/recipe')
+
+
+SEARCHES = [
+    {'meal_search': 'chicken'},
+    {'meal_search': 'chicken', 'category_search': 'Dinner'},
+    {'category_search': 'Dessert', 'tags_search': 'cake', 'vegetarian_filter': True},
+    {'area_search': 'Italian', 'ingredients_search': 'garlic "olive oil"'},
+    {'tags_search': 'easy quick', 'kosher_filter': True, 'num_ingredients': 'Moderate (0-10)'},
+    {'meal_search': 'pie', 'ingredients_search': 'butter sugar flour', 'vegetarian_filter': True},
+    {'meal_search': 'zzz', 'ingredients_search': 'egg', 'category_search': 'Soup'},
+]
+
+
+def sequential_filter(combined_df, ingredient_index, meal_search='', category_search='', area_search='', tags_search='',
+                      ingredients_search='', vegetarian_filter=False, kosher_filter=False, num_ingredients=''):
+    """The filter block main.py used before the query planner: one filtered copy per predicate."""
+    if meal_search:
+        combined_df = combined_df[combined_df['strMeal'].str.contains(meal_search, case=False, na=False)]
+    if category_search:
+        if 'spoonacular' in combined_df['source'].unique():
+            combined_df = combined_df[combined_df['parsed_dish_types'].str.contains(category_search, case=False, na=False)]
+        else:
+            combined_df = combined_df[combined_df['strTags'].str.contains(category_search, case=False, na=False)]
+    if area_search:
+        combined_df = combined_df[combined_df['strTags'].str.contains(area_search, case=False, na=False)]
+    for tag in tags_search.split():
+        combined_df = combined_df[combined_df['strTags'].str.contains(tag, case=False, na=False)]
+    if ingredients_search:
+        combined_df = combined_df[combined_df.index.isin(ingredient_index.search(parse_ingredient_terms(ingredients_search)))]
+    if vegetarian_filter:
+        combined_df = combined_df[combined_df['is_vegetarian']]
+    if kosher_filter:
+        combined_df = combined_df[is_kosher(combined_df)]
+    ingredient_count_filter = ingredient_count_mask(combined_df, num_ingredients)
+    if ingredient_count_filter is not None:
+        combined_df = combined_df[ingredient_count_filter]
+    return combined_df
+
+
+def bench_query_planner(base_dir, sizes):
+    """Sequential filtered copies against the single-mask query plan, on the corpus repeated to each size."""
+    corpus = get_corpus(base_dir)
+    print(f"{'rows':>10} {'search':<70} {'sequential ms':>14} {'plan ms':>9}")
+    for rows in sizes:
+        combined_df = scale_corpus(corpus.combined_df, rows)
+        ingredient_index = IngredientIndex(scale_corpus(corpus.details.column('ingredients').to_frame(), rows)['ingredients'].fillna(''))
+        for search in SEARCHES:
+            sequential_time, expected = best_time(lambda: sequential_filter(combined_df, ingredient_index, **search))
+            plan_time, actual = best_time(lambda: plan_search(combined_df, ingredient_index, **search).execute())
+            if list(expected.index) != list(combined_df.index[actual]):
+                raise AssertionError(f'Query plan results differ from the sequential filters for {search} at {rows} rows')
+            print(f'{rows:>10} {str(search):<70} {sequential_time * 1000:>14.2f} {plan_time * 1000:>9.2f}')
+    query_plan = plan_search(corpus.combined_df, corpus.ingredient_index, **SEARCHES[3])
+    query_plan.execute()
+    print(query_plan.explain().to_string(index=False))
+
+
+TITLE_QUERIES = ['chicken', 'Chocolate Cake', 'bolognese', 'pie', 'lasagna soup', 'zzz', 'ab']
+
+
+def bench_title_search(base_dir, rows):
+    """Linear `str.contains` scan against the trigram index on synthetic titles."""
+    titles = synthetic_titles(get_corpus(base_dir).combined_df['strMeal'], rows)
+    build_time, index = best_time(lambda: TrigramIndex(titles), repeat=1)
+    print(f'{rows} synthetic titles, trigram index built in {build_time:.2f}s')
+    print(f"{'query':<16} {'matches':>8} {'scan ms':>9} {'index ms':>9} {'speedup':>8}")
+    for query in TITLE_QUERIES:
+        scan_time, expected = best_time(lambda: np.flatnonzero(titles.str.contains(query, case=False, na=False)))
+        index_time, actual = best_time(lambda: index.search(query))
+        if list(expected) != list(actual):
+            raise AssertionError(f'Trigram index results differ from the scan for {query!r}')
+        print(f'{query:<16} {len(expected):>8} {scan_time * 1000:>9.1f} {index_time * 1000:>9.1f} '
+              f'{scan_time / max(index_time, 1e-9):>7.1f}x')
+    fuzzy_time, (positions, scores) = best_time(lambda: index.fuzzy('chiken curyy', limit=3))
+    print(f"fuzzy 'chiken curyy' in {fuzzy_time * 1000:.1f} ms: {list(titles.iloc[positions])}")
+
+
+def bench_facet_counts(base_dir, rows):
+    """Option counts for every category and region: per-option `str.contains` scans against bitmaps."""
+    corpus = get_corpus(base_dir)
+    df = scale_corpus(corpus.combined_df, rows)
+    build_time, index = best_time(lambda: FacetIndex(df, corpus.categories), repeat=1)
+    base = df['is_vegetarian'].to_numpy(dtype=bool)
+    dish_types, tags = df['parsed_dish_types'].astype(str), df['strTags'].astype(str)
+
+    def scans():
+        return ([int((base & dish_types.str.contains(category_pattern(category), case=False, na=False)).sum())
+                 for category in index.categories],
+                [int((base & tags.str.contains(area, case=False, na=False)).sum()) for area in AREAS])
+
+    def bitmaps():
+        packed = pack(base)
+        return (index.counts(index.category_bitmaps['parsed_dish_types'], packed).tolist(),
+                index.counts(index.area_bitmaps, packed).tolist())
+
+    scan_time, expected = best_time(scans, repeat=1)
+    bitmap_time, actual = best_time(bitmaps)
+    if expected != actual:
+        raise AssertionError('Bitmap facet counts differ from the scans')
+    options = len(index.categories) + len(index.areas)
+    print(f'{rows} rows, {options} options: bitmaps built in {build_time:.2f}s, scans {scan_time * 1000:.1f} ms, '
+          f'bitmap counts {bitmap_time * 1000:.2f} ms ({scan_time / max(bitmap_time, 1e-9):.0f}x)')
+
+
+SERVER_QUERIES = [{'meal_search': 'chicken'}, {'ingredients_search': 'garlic onion', 'sort_by': 'Top Rated'},
+                  {'category_search': 'Dessert', 'page': 2}, {'meal_search': 'chiken curyy'},
+                  {'area_search': 'Italian', 'vegetarian_filter': 'true'}, {'tags_search': 'Soup'}]
+
+
+async def search_client(port, requests, latencies, statuses):
+    """One keep-alive connection sending GET /search requests back to back."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for i in range(requests):
+        target = '/search?' + urlencode(SERVER_QUERIES[i % len(SERVER_QUERIES)])
+        start = time.perf_counter()
+        writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        json.loads(await reader.readexactly(length))
+        latencies.append(time.perf_counter() - start)
+        statuses.append(status)
+    writer.close()
+
+
+async def load_test(engine, clients, requests, max_concurrency):
+    server = await SearchServer(engine, max_concurrency=max_concurrency).start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    latencies, statuses = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(search_client(port, requests, latencies, statuses) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return elapsed, np.array(latencies), statuses
+
+
+def bench_search_server(base_dir, client_counts=(1, 8, 32), requests=20, max_concurrency=4):
+    """Throughput and latency percentiles of /search under concurrent keep-alive clients.
+
+    Clients run in the server's process and event loop, so the numbers include their
+    overhead and are a floor for what separate client machines would see.
+    """
+    engine = get_search_engine(base_dir)
+    engine.corpus
+    print(f"{'clients':>8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'non-200':>8}")
+    for clients in client_counts:
+        elapsed, latencies, statuses = asyncio.run(load_test(engine, clients, requests, max_concurrency))
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print(f'{clients:>8} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} {p50:>8.1f} {p99:>8.1f} '
+              f'{sum(status != 200 for status in statuses):>8}')
+
+
+if __name__ == '__main__':
+    # Usage: python benchmark.py [rows ...]
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000]
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    bench_recipes_parsing(base_dir)
+    bench_corpus_tiers(base_dir)
+    bench_memory(base_dir)
+    bench_query_planner(base_dir, sizes)
+    bench_title_search(base_dir, 1_000_000)
+    bench_facet_counts(base_dir, 1_000_000)
+    bench_search_server(base_dir)
+    combined_df = load_corpus(base_dir, columns=None)
+    bench_ingredient_search(combined_df, sizes)
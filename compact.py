@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Low-cardinality text columns held in memory as categoricals
+CATEGORICAL_COLUMNS = ['source', 'strCategory', 'strArea', 'strTags', 'parsed_dish_types']
+
+
+class InternedLists:
+    """Per-row lists of strings stored as int32 ids into one shared vocabulary.
+
+    Row i holds ids[offsets[i]:offsets[i + 1]]; each distinct string is kept once in
+    `vocabulary`, an Arrow string array. Built from comma-joined text, the lists keep
+    empty items, so `joined` gives back the original strings exactly.
+    """
+
+    def __init__(self, offsets, ids, vocabulary):
+        self.offsets = offsets
+        self.ids = ids
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_joined(cls, values, separator=', '):
+        values = pd.Series(values, dtype=object).fillna('').reset_index(drop=True)
+        items = values.str.split(separator).explode()
+        codes, vocabulary = pd.factorize(items.to_numpy(dtype=object))
+        lengths = np.bincount(items.index.to_numpy(), minlength=len(values))
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return cls(offsets, codes.astype(np.int32), pa.array(list(vocabulary), type=pa.string()))
+
+    def extend(self, values, separator=', '):
+        """New InternedLists with the comma-joined `values` appended as further rows.
+
+        Strings already interned keep their ids; only the new rows are split and looked up.
+        """
+        added = InternedLists.from_joined(values, separator)
+        vocabulary = pd.Index(self.vocabulary.to_pylist(), dtype=object)
+        added_vocabulary = pd.Index(added.vocabulary.to_pylist(), dtype=object)
+        codes = vocabulary.get_indexer(added_vocabulary)
+        unseen = codes < 0
+        codes[unseen] = len(vocabulary) + np.arange(unseen.sum())
+        return InternedLists(
+            np.concatenate([self.offsets, self.offsets[-1] + added.offsets[1:]]),
+            np.concatenate([self.ids, codes[added.ids].astype(np.int32)]),
+            pa.concat_arrays([self.vocabulary, added.vocabulary.filter(pa.array(unseen))]),
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def rows(self):
+        """Row position of every id in `ids`."""
+        return np.repeat(np.arange(len(self)), self.lengths())
+
+    def joined(self, positions=None, separator=', '):
+        """The lists at `positions` (all rows by default) joined back into strings."""
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        # Index into `ids` of every item of the selected rows, in order
+        items = np.arange(offsets[-1]) + np.repeat(starts - offsets[:-1], lengths)
+        lists = pa.LargeListArray.from_arrays(pa.array(offsets), self.vocabulary.take(pa.array(self.ids[items])))
+        return pc.binary_join(lists, separator).to_pylist()
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.ids.nbytes + self.vocabulary.nbytes
+
+
+def compact_frame(df):
+    """df with categoricals for CATEGORICAL_COLUMNS and the smallest fitting integer types."""
+    df = df.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    for column in df.select_dtypes('integer').columns:
+        df[column] = pd.to_numeric(df[column], downcast='integer')
+    return df
+
+
+def concat_frames(frames):
+    """pd.concat of frames with the same columns, renumbering the rows from 0.
+
+    Categorical columns stay categorical (over the union of the frames' categories)
+    instead of falling back to object.
+    """
+    frames = list(frames)
+    for column in CATEGORICAL_COLUMNS:
+        if all(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            categories = frames[0][column].cat.categories
+            for df in frames[1:]:
+                added = df[column].cat.categories
+                categories = categories.append(added[~added.isin(categories)].astype(categories.dtype))
+            frames = [df.assign(**{column: df[column].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def bytes_per_row(df, *extra):
+    """Deep memory of df plus any extra objects with an `nbytes`, per row."""
+    total = df.memory_usage(deep=True).sum() + sum(item.nbytes for item in extra)
+    return total / max(len(df), 1)
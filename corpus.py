@@ -0,0 +1,577 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from utils import get_combined_categories
+from ingest import load_sources, timed, format_timings
+from ingredient_index import IngredientIndex
+from similarity import SimilarityEngine
+from neighbors import build_neighbor_table, load_neighbor_table
+from pantry import PantryIndex
+from numeric_index import NUMERIC_COLUMNS, DIET_COLUMNS, NumericIndex, compute_numeric_fields
+from facets import FACET_COLUMNS, FacetIndex, compute_facets
+from compact import InternedLists, compact_frame, concat_frames
+from recipes_tab import parse_recipes_table
+from spoonacular_tab import parse_spoonacular_frame
+from trigram import TrigramIndex
+from profiling import stage
+
+# Bump whenever the normalization below or CORPUS_COLUMNS change, so that
+# compiled files from an older build are rebuilt instead of loaded.
+SCHEMA_VERSION = 8
+
+COMPILED_CORPUS_FILE = 'combined.parquet'
+SOURCES = ['meals', 'recipes', 'spoonacular']
+SOURCE_FILES = [f'{source}.parquet' for source in SOURCES]
+METADATA_KEY = b'recipes_corpus'
+# Each source's own id column; a row's stable `recipe_id` is '<source>:<id>'
+SOURCE_ID_COLUMNS = {'meals': 'idMeal', 'recipes': 'id', 'spoonacular': 'id'}
+
+# Appended recipes, as small compiled segments merged on top of the compiled corpus (see deltas.py)
+DELTAS_DIR = 'deltas'
+DELTA_SUFFIX = '.corpus.parquet'
+
+# Columns the app reads from the combined DataFrame
+CORPUS_COLUMNS = [
+    'recipe_id', 'source', 'strMeal', 'strMealThumb', 'strCategory', 'strArea', 'strTags', 'parsed_dish_types',
+    'ingredients', 'isolated_ingredients', 'strInstructions', 'video_url'
+] + FACET_COLUMNS + list(NUMERIC_COLUMNS) + list(DIET_COLUMNS)
+
+# Heavy text only needed to display a result: the detail tier, read by row id on demand.
+DETAIL_COLUMNS = ['ingredients', 'strInstructions', 'video_url']
+# Comma-joined lists held in memory as interned id arrays (see Corpus.ingredient_lists)
+INTERNED_COLUMNS = ['isolated_ingredients']
+# Everything else is the search tier, loaded eagerly
+SEARCH_COLUMNS = [column for column in CORPUS_COLUMNS if column not in DETAIL_COLUMNS + INTERNED_COLUMNS]
+
+# Small row groups keep a detail read close to the rows of one results page
+ROW_GROUP_SIZE = 128
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_hashes(base_dir):
+    return {name: file_hash(os.path.join(base_dir, name)) for name in SOURCE_FILES}
+
+
+# Add isolated ingredients column
+def get_isolated_ingredients(row):
+    if pd.notna(row.get('isolated_ingredients')) and row['isolated_ingredients'].strip():
+        return row['isolated_ingredients']
+    if row['source'] == 'meals':
+        return ', '.join([row[f'strIngredient{i}'] for i in range(1, 21) if pd.notna(row.get(f'strIngredient{i}'))])
+    elif row['source'] == 'recipes' or row['source'] == 'spoonacular':
+        return ', '.join(row['search_ingredients']) if isinstance(row['search_ingredients'], list) else row['search_ingredients']
+    else:
+        return ''
+
+
+# Function to combine ingredients and measurements for meals
+def combine_ingredients_and_measurements(row):
+    ingredients = []
+    count = 1
+    for i in range(1, 21):
+        ingredient = row.get(f'strIngredient{i}')
+        measurement = row.get(f'strMeasure{i}')
+        if pd.notna(ingredient) and pd.notna(measurement) and ingredient.strip() and measurement.strip():
+            ingredients.append(f"{count}. {measurement} {ingredient}")
+            count += 1
+        elif pd.notna(ingredient) and ingredient.strip():
+            ingredients.append(f"{count}. {ingredient}")
+            count += 1
+    return '\n'.join(ingredients)
+
+
+# Function to convert instructions to numbered list
+def convert_instructions_to_numbered_list(instructions):
+    if instructions is None:
+        return ""
+    steps = instructions.split('\n')
+    numbered_steps = [f"{i+1}. {step.strip()}" for i, step in enumerate(steps) if step.strip()]
+    return '\n'.join(numbered_steps)
+
+
+def recipe_ids(source, df):
+    """Stable id of each row of one source (a few meals share an idMeal, and so an id)."""
+    return source + ':' + df[SOURCE_ID_COLUMNS[source]].astype(str)
+
+
+def build_combined_df(base_dir, workers=None, timings=None):
+    """Load the three sources and normalize them into one combined DataFrame.
+
+    Per-stage wall times are recorded in `timings` when given.
+    """
+    timings = {} if timings is None else timings
+    meals_df, recipes_df, spoonacular_df = load_sources(base_dir, workers=workers, timings=timings)
+    return compile_sources(meals_df, recipes_df, spoonacular_df, timings)
+
+
+def compile_sources(meals_df, recipes_df, spoonacular_df, timings=None):
+    """Normalize loaded rows of the three sources into combined rows."""
+    timings = {} if timings is None else timings
+
+    # Add an index to each DataFrame
+    meals_df['source'] = 'meals'
+    recipes_df['source'] = 'recipes'
+    spoonacular_df['source'] = 'spoonacular'
+    for source, df in zip(SOURCES, [meals_df, recipes_df, spoonacular_df]):
+        df['recipe_id'] = recipe_ids(source, df)
+
+    with timed(timings, 'normalize'):
+        combined_df = normalize_sources(meals_df, recipes_df, spoonacular_df)
+
+    # Precompute the dietary and ingredient-count facets used by the filters, and the
+    # numeric fields and diet flags of the range filters
+    with timed(timings, 'facets'):
+        combined_df = combined_df.join(compute_facets(combined_df['ingredients']))
+        combined_df = combined_df.assign(**compute_numeric_fields(combined_df))
+    return combined_df
+
+
+def compile_rows(source, raw_df):
+    """Combined rows (CORPUS_COLUMNS) for raw rows of one source, with the columns of its Parquet file."""
+    frames = {name: pd.DataFrame(columns=[SOURCE_ID_COLUMNS[name]]) for name in SOURCES}
+    if source == 'recipes':
+        frames[source] = parse_recipes_table(pa.Table.from_pandas(raw_df, preserve_index=False))
+    elif source == 'spoonacular':
+        frames[source] = parse_spoonacular_frame(raw_df)
+    else:
+        frames[source] = raw_df.copy()
+    combined_df = compile_sources(*frames.values())
+    # Columns only other sources fill are null, as they are for this source's rows in a full build
+    for column in CORPUS_COLUMNS:
+        if column not in combined_df.columns:
+            combined_df[column] = pd.Series(None, index=combined_df.index, dtype=object)
+    return combined_df[CORPUS_COLUMNS].reset_index(drop=True)
+
+
+def normalize_sources(meals_df, recipes_df, spoonacular_df):
+    # Combine the three DataFrames
+    combined_df = pd.concat([meals_df, recipes_df, spoonacular_df], ignore_index=True)
+
+    rows = len(combined_df)
+
+    # Add a temporary column for video URLs
+    with stage('normalize.video_url', rows=rows):
+        combined_df['video_url'] = combined_df.apply(
+            lambda row: row['strYoutube'] if row['source'] == 'meals' else row.get('original_video_url', ''), axis=1
+        ).fillna('')
+
+    with stage('normalize.isolated_ingredients', rows=rows):
+        combined_df['isolated_ingredients'] = combined_df.apply(get_isolated_ingredients, axis=1)
+
+    # Apply the functions to the combined DataFrame
+    with stage('normalize.ingredients', rows=rows):
+        combined_df['ingredients'] = combined_df.apply(lambda row: combine_ingredients_and_measurements(row) if row['source'] == 'meals' else row['parsed_ingredients'], axis=1).fillna('')
+    with stage('normalize.instructions', rows=rows):
+        combined_df['strInstructions'] = combined_df.apply(
+            lambda row: convert_instructions_to_numbered_list(row['strInstructions']) if row['source'] == 'meals'
+            else row['temp_parsed_instructions'] if row['source'] == 'spoonacular'
+            else row['parsed_instructions'],
+            axis=1
+        )
+    return combined_df
+
+
+def read_corpus_metadata(path):
+    """Return the build metadata of a compiled corpus file, or None if it is missing or unreadable."""
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if METADATA_KEY not in metadata:
+        return None
+    return json.loads(metadata[METADATA_KEY])
+
+
+def build_corpus(base_dir, hashes=None, workers=None, neighbors=True):
+    """Normalize the sources once and write the compiled corpus Parquet next to them.
+
+    Also precomputes the similar-items neighbor table for the new corpus, unless
+    neighbors=False; similar items are then computed on demand.
+    """
+    if hashes is None:
+        hashes = source_hashes(base_dir)
+    timings = {}
+    combined_df = build_combined_df(base_dir, workers=workers, timings=timings)[CORPUS_COLUMNS].reset_index(drop=True)
+
+    metadata = {
+        'schema_version': SCHEMA_VERSION,
+        'sources': hashes,
+        'built_at': datetime.now(timezone.utc).isoformat(),
+        'rows': len(combined_df),
+        'timings': timings,
+    }
+    with timed(timings, 'write'):
+        write_compiled(pa.Table.from_pandas(combined_df, preserve_index=False), metadata,
+                       os.path.join(base_dir, COMPILED_CORPUS_FILE))
+
+    if neighbors:
+        metadata['neighbors'] = build_neighbor_table(base_dir, combined_df, metadata, workers=workers)
+    return metadata
+
+
+def write_compiled(table, metadata, path, replace=True):
+    """Write compiled rows with their build metadata to path, through a temporary file.
+
+    With replace=False the temporary path is returned instead of being moved into place.
+    """
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), METADATA_KEY: json.dumps(metadata)})
+    # Write to a temporary file first so readers never see a partial corpus
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+    if not replace:
+        return tmp_path
+    os.replace(tmp_path, path)
+    return path
+
+
+def delta_segment_paths(base_dir):
+    """Compiled delta segments under base_dir, oldest first."""
+    directory = os.path.join(base_dir, DELTAS_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(DELTA_SUFFIX)]
+
+
+def raw_delta_path(segment_path):
+    """The raw source rows a delta segment was compiled from."""
+    return segment_path[:-len(DELTA_SUFFIX)] + '.parquet'
+
+
+def delta_source(segment_path):
+    # Segments are named '<sequence>-<source>.corpus.parquet'
+    return os.path.basename(segment_path)[:-len(DELTA_SUFFIX)].split('-', 1)[1]
+
+
+def write_delta_segment(path, source, raw_df):
+    """Compile raw rows of one source into a delta segment at path; returns its metadata."""
+    combined_df = compile_rows(source, raw_df)
+    metadata = {
+        'schema_version': SCHEMA_VERSION,
+        'source': source,
+        'built_at': datetime.now(timezone.utc).isoformat(),
+        'rows': len(combined_df),
+    }
+    write_compiled(pa.Table.from_pandas(combined_df, preserve_index=False), metadata, path)
+    return metadata
+
+
+def read_delta_segment(path):
+    """Every column of a delta segment, and its metadata; a segment from an older schema is recompiled first."""
+    metadata = read_corpus_metadata(path)
+    if metadata is None or metadata.get('schema_version') != SCHEMA_VERSION:
+        metadata = write_delta_segment(path, delta_source(path), pd.read_parquet(raw_delta_path(path)))
+    return compact_frame(pd.read_parquet(path)), metadata
+
+
+def corpus_is_current(base_dir, hashes=None):
+    metadata = read_corpus_metadata(os.path.join(base_dir, COMPILED_CORPUS_FILE))
+    if metadata is None or metadata.get('schema_version') != SCHEMA_VERSION:
+        return False
+    if hashes is None:
+        hashes = source_hashes(base_dir)
+    return metadata.get('sources') == hashes
+
+
+def load_corpus(base_dir, columns=SEARCH_COLUMNS):
+    """Load the compiled corpus, rebuilding it first if any source file has changed.
+
+    Only the search tier is read by default; pass columns=None for every column. Text
+    columns are stored plainly on disk (a dictionary column would repeat its whole
+    dictionary in every row group) and made categorical here.
+    """
+    hashes = source_hashes(base_dir)
+    if not corpus_is_current(base_dir, hashes):
+        with stage('corpus.build'):
+            build_corpus(base_dir, hashes)
+    with stage('corpus.read') as record:
+        combined_df = compact_frame(pd.read_parquet(os.path.join(base_dir, COMPILED_CORPUS_FILE), columns=columns))
+        record['rows'] = len(combined_df)
+    return combined_df
+
+
+class CorpusDetails:
+    """Detail tier of one compiled corpus build, read from its row groups by row id.
+
+    The file is opened once and held open for as long as this object lives, so a rebuild
+    or a compaction can replace or remove it at any time: reads keep seeing the build the
+    object was created for until the Corpus holding it is released. Opening a build other
+    than `built_at` (or a file already removed) raises RuntimeError.
+    """
+
+    def __init__(self, path, built_at):
+        self.path = path
+        self.built_at = built_at
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            raise RuntimeError(f'{path} was compacted away; reload the corpus')
+        stat = os.fstat(f.fileno())
+        # The build opened, as source_signature records a file
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+        # PythonFile serializes reads at an offset, so threads can share it
+        self.file = pa.PythonFile(f, mode='r')
+        parquet_file = pq.ParquetFile(self.file)
+        metadata = json.loads((parquet_file.schema_arrow.metadata or {}).get(METADATA_KEY, b'{}'))
+        if metadata.get('built_at') != built_at:
+            self.file.close()
+            raise RuntimeError(f'{path} was rebuilt; reload the corpus')
+        self.metadata = parquet_file.metadata
+        sizes = [self.metadata.row_group(i).num_rows for i in range(self.metadata.num_row_groups)]
+        self._row_group_starts = np.concatenate([[0], np.cumsum(sizes)])
+
+    def _open(self):
+        # A reader per call over the shared file; the footer is parsed only once
+        return pq.ParquetFile(self.file, metadata=self.metadata)
+
+    def column(self, name):
+        """One whole column of the compiled corpus."""
+        return self._open().read(columns=[name]).column(name).to_pandas()
+
+    def table(self, columns):
+        """Every row of the given columns, as an Arrow table."""
+        return self._open().read(columns=columns)
+
+    def fetch(self, row_ids, columns=DETAIL_COLUMNS):
+        """The given columns for row_ids, indexed by row id in the order given."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        parquet_file = self._open()
+        starts = self._row_group_starts
+        row_groups = np.searchsorted(starts, row_ids, side='right') - 1
+        groups, group_of_row = np.unique(row_groups, return_inverse=True)
+        if not len(groups):
+            return pd.DataFrame(columns=columns, index=pd.Index(row_ids))
+        table = parquet_file.read_row_groups(groups.tolist(), columns=columns)
+        # Position of each row id within the concatenated row groups
+        group_offsets = np.concatenate([[0], np.cumsum(starts[groups + 1] - starts[groups])])
+        positions = group_offsets[group_of_row] + row_ids - starts[row_groups]
+        details = table.take(positions).to_pandas()
+        details.index = pd.Index(row_ids)
+        return details
+
+
+class SegmentedDetails:
+    """Detail tier of the compiled corpus followed by its delta segments, addressed by merged row id."""
+
+    def __init__(self, segments, starts):
+        # CorpusDetails of each segment, and the first row id of each one followed by the total
+        self.segments = segments
+        self.starts = np.asarray(starts, dtype=np.int64)
+
+    def extended(self, segment, rows):
+        return SegmentedDetails(self.segments + [segment], np.append(self.starts, self.starts[-1] + rows))
+
+    def column(self, name):
+        return pd.concat([segment.column(name) for segment in self.segments], ignore_index=True)
+
+    def fetch(self, row_ids, columns=DETAIL_COLUMNS):
+        """Like CorpusDetails.fetch, reading each segment's rows from its own file."""
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        owners = np.searchsorted(self.starts, row_ids, side='right') - 1
+        if len(self.segments) == 1 or not len(row_ids):
+            return self.segments[0].fetch(row_ids, columns)
+        parts = [self.segments[owner].fetch(row_ids[owners == owner] - self.starts[owner], columns)
+                 for owner in np.unique(owners)]
+        # The parts hold the rows grouped by segment; put them back in the order asked for
+        details = pd.concat(parts).iloc[np.argsort(np.argsort(owners, kind='stable'))]
+        details.index = pd.Index(row_ids)
+        return details
+
+
+class Corpus:
+    """Read-only snapshot of the combined corpus shared by every rerun and session in the process.
+
+    Callers must not modify `combined_df` in place; derive new frames instead. Rows of
+    delta segments (recipes appended since the compiled corpus was built) follow the
+    compiled rows. Appending a recipe again supersedes its earlier rows: they keep their
+    row ids but drop out of `live`, the mask every search and similar-items lookup applies
+    (None while nothing is superseded).
+    """
+
+    def __init__(self, base_dir, combined_df, metadata, signature):
+        self.combined_df = combined_df
+        self.metadata = metadata
+        self.details = SegmentedDetails([CorpusDetails(os.path.join(base_dir, COMPILED_CORPUS_FILE),
+                                                       (metadata or {}).get('built_at'))], [0, len(combined_df)])
+        self.segments = ()
+        self.live = None
+        self.categories = get_combined_categories(combined_df, combined_df)
+        rows = len(combined_df)
+        # The ingredient text is read outside the search tier; the index keeps it for phrase checks
+        with stage('corpus.ingredient_index', rows=rows):
+            self.ingredient_index = IngredientIndex(self.details.column('ingredients').fillna(''))
+        with stage('corpus.ingredient_lists', rows=rows):
+            self.ingredient_lists = InternedLists.from_joined(self.details.column('isolated_ingredients'))
+        with stage('corpus.title_index', rows=rows):
+            self.title_index = TrigramIndex(combined_df['strMeal'])
+        with stage('corpus.facet_index', rows=rows):
+            self.facet_index = FacetIndex(combined_df, self.categories)
+        with stage('corpus.numeric_indexes', rows=rows):
+            self.numeric_indexes = {column: NumericIndex(combined_df[column]) for column in NUMERIC_COLUMNS}
+        with stage('corpus.similarity_engine', rows=rows):
+            self.similarity_engine = SimilarityEngine(combined_df, self.ingredient_lists)
+        with stage('corpus.pantry_index', rows=rows):
+            self.pantry_index = PantryIndex(self.similarity_engine)
+        with stage('corpus.neighbor_table', rows=rows):
+            self.neighbor_table = (load_neighbor_table(base_dir, combined_df, metadata, self.ingredient_lists)
+                                   if metadata else None)
+        self.signature = signature
+
+    def extended(self, paths, signature):
+        """A new Corpus with the delta segments at `paths` merged on top of this one.
+
+        Every index is extended with the segments' rows, and the neighbor table updated for
+        them, instead of being rebuilt, so the cost follows the size of the segments.
+        """
+        corpus = copy.copy(self)
+        start = len(self.combined_df)
+        frames = []
+        with stage('corpus.read_deltas') as record:
+            for path in paths:
+                df, metadata = read_delta_segment(path)
+                frames.append(df)
+                corpus.details = corpus.details.extended(CorpusDetails(path, metadata['built_at']), len(df))
+            delta_df = concat_frames(frames)
+            delta_df.index = pd.RangeIndex(start, start + len(delta_df))
+            record['rows'] = len(delta_df)
+        corpus.combined_df = concat_frames([self.combined_df, delta_df[SEARCH_COLUMNS]])
+        rows = len(corpus.combined_df)
+
+        # The last row appended for a recipe id wins
+        with stage('corpus.live', rows=rows):
+            was_live = np.ones(start, dtype=bool) if self.live is None else self.live
+            live = np.ones(rows, dtype=bool)
+            live[:start] = was_live & ~self.combined_df['recipe_id'].isin(delta_df['recipe_id']).to_numpy()
+            live[start:] = ~delta_df['recipe_id'].duplicated(keep='last').to_numpy()
+            superseded = np.flatnonzero(was_live & ~live[:start])
+            corpus.live = None if live.all() else live
+
+        with stage('corpus.ingredient_index', rows=len(delta_df)):
+            corpus.ingredient_index = self.ingredient_index.extend(delta_df['ingredients'].fillna(''))
+        with stage('corpus.ingredient_lists', rows=len(delta_df)):
+            corpus.ingredient_lists = self.ingredient_lists.extend(delta_df['isolated_ingredients'])
+        with stage('corpus.title_index', rows=len(delta_df)):
+            corpus.title_index = self.title_index.extend(delta_df['strMeal'])
+        with stage('corpus.facet_index', rows=len(delta_df)):
+            corpus.facet_index = self.facet_index.extend(delta_df)
+        with stage('corpus.numeric_indexes', rows=len(delta_df)):
+            corpus.numeric_indexes = {column: index.extend(delta_df[column])
+                                      for column, index in self.numeric_indexes.items()}
+        with stage('corpus.similarity_engine', rows=len(delta_df)):
+            corpus.similarity_engine = self.similarity_engine.extend(delta_df, corpus.ingredient_lists, corpus.live)
+        with stage('corpus.pantry_index', rows=len(delta_df)):
+            corpus.pantry_index = self.pantry_index.extend(corpus.similarity_engine)
+        with stage('corpus.neighbor_table', rows=len(delta_df)):
+            if self.neighbor_table is not None:
+                corpus.neighbor_table = self.neighbor_table.extend(corpus.similarity_engine, corpus.combined_df,
+                                                                   corpus.ingredient_lists, superseded)
+        corpus.segments = self.segments + tuple(paths)
+        corpus.signature = signature
+        return corpus
+
+    def with_details(self, df):
+        """df (rows of combined_df) with the detail-tier columns added, e.g. for the rows being shown."""
+        return df.join(self.details.fetch(df.index))
+
+    def similar_items(self, labels):
+        """Top similar items for each row label, from the neighbor table when it is current."""
+        if self.neighbor_table is not None:
+            return self.neighbor_table.top_similar(labels)
+        return self.similarity_engine.top_similar(labels)
+
+
+_corpus_lock = threading.Lock()
+_corpus_cache = {}
+
+
+def source_signature(base_dir):
+    """Cheap change detector for the source files and the compiled corpus: their mtimes and sizes.
+
+    The compiled corpus is in it so that a rebuild by another process (python corpus.py
+    --force) is picked up too; it is (name, None, None) while missing.
+    """
+    signature = []
+    for name in SOURCE_FILES:
+        stat = os.stat(os.path.join(base_dir, name))
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    try:
+        stat = os.stat(os.path.join(base_dir, COMPILED_CORPUS_FILE))
+        signature.append((COMPILED_CORPUS_FILE, stat.st_mtime_ns, stat.st_size))
+    except FileNotFoundError:
+        signature.append((COMPILED_CORPUS_FILE, None, None))
+    return tuple(signature)
+
+
+def corpus_signature(base_dir):
+    """The source signature and the names of the delta segments present."""
+    return source_signature(base_dir), tuple(os.path.basename(path) for path in delta_segment_paths(base_dir))
+
+
+def get_corpus(base_dir):
+    """Return the process-wide Corpus for base_dir, reloading it when a source file changes.
+
+    A rebuild of the compiled corpus (e.g. by another process) reloads it too; new delta
+    segments alone are merged into the current Corpus (see Corpus.extended) rather than
+    reloading it. A reload builds a complete new Corpus before swapping it in,
+    so callers holding the previous one keep a consistent snapshot. While one thread
+    reloads, other callers keep getting the previous Corpus instead of waiting.
+    """
+    base_dir = os.path.abspath(base_dir)
+    signature = corpus_signature(base_dir)
+    corpus = _corpus_cache.get(base_dir)
+    if corpus is not None and corpus.signature == signature:
+        return corpus
+
+    if not _corpus_lock.acquire(blocking=corpus is None):
+        return corpus
+    try:
+        # Another thread may have finished the reload while we were waiting
+        corpus = _corpus_cache.get(base_dir)
+        if corpus is None or corpus.signature != signature:
+            sources, segments = signature
+            merged = len(corpus.signature[1]) if corpus is not None else 0
+            if corpus is None or corpus.signature[0] != sources or segments[:merged] != corpus.signature[1]:
+                merged = 0
+                combined_df = load_corpus(base_dir)
+                metadata = read_corpus_metadata(os.path.join(base_dir, COMPILED_CORPUS_FILE))
+                corpus = Corpus(base_dir, combined_df, metadata, None)
+                # load_corpus may have just rebuilt the compiled corpus: record the build opened
+                sources = sources[:-1] + ((COMPILED_CORPUS_FILE,) + corpus.details.segments[0].stat,)
+                corpus.signature = (sources, ())
+                signature = (sources, segments)
+            paths = [os.path.join(base_dir, DELTAS_DIR, name) for name in segments[merged:]]
+            corpus = corpus.extended(paths, signature) if paths else corpus
+            _corpus_cache[base_dir] = corpus
+        return corpus
+    finally:
+        _corpus_lock.release()
+
+
+if __name__ == '__main__':
+    # Usage: python corpus.py [--force] [base_dir]
+    args = [arg for arg in sys.argv[1:] if arg != '--force']
+    force = '--force' in sys.argv[1:]
+    base_dir = args[0] if args else os.path.dirname(os.path.abspath(__file__))
+    if not force and corpus_is_current(base_dir):
+        print(f'{COMPILED_CORPUS_FILE} is up to date')
+    else:
+        metadata = build_corpus(base_dir)
+        print(f"Built {COMPILED_CORPUS_FILE}: {metadata['rows']} rows (schema v{metadata['schema_version']})")
+        print(format_timings(metadata['timings']))
+        neighbors = metadata['neighbors']
+        print(f"Built neighbor table: {neighbors['rows']} rows with {neighbors['workers']} workers in "
+              f"{neighbors['seconds']:.2f}s ({neighbors['rows_per_second']:.0f} rows/s)")
@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from corpus import (get_corpus, file_hash, recipe_ids, raw_delta_path, delta_source, delta_segment_paths,
+                    write_delta_segment, write_compiled, SOURCES, SOURCE_ID_COLUMNS, DELTAS_DIR, DELTA_SUFFIX,
+                    SCHEMA_VERSION, CORPUS_COLUMNS, COMPILED_CORPUS_FILE)
+from neighbors import write_neighbor_table, NEIGHBORS_FILE
+from meals_tab import MEALS_COLUMNS
+from recipes_tab import RECIPES_COLUMNS
+from spoonacular_tab import SPOONACULAR_COLUMNS, parse_ingredients
+
+# Columns a delta keeps of each source's rows: the ones the corpus build reads
+SOURCE_COLUMNS = {'meals': MEALS_COLUMNS, 'recipes': RECIPES_COLUMNS, 'spoonacular': SPOONACULAR_COLUMNS}
+
+# The background compactor folds the deltas into the base once this many segments have piled up
+COMPACT_MIN_SEGMENTS = 8
+COMPACT_INTERVAL = 300
+
+_append_lock = threading.Lock()
+_compact_lock = threading.Lock()
+
+
+def dish_type_words(dish_types):
+    # spoonacular.parquet's parsed_dish_types: the words of dishTypes, comma separated
+    return ', '.join(re.findall(r'[^\W\d_]+', dish_types)) if isinstance(dish_types, str) else None
+
+
+def source_rows(source, df):
+    """New rows of one source (e.g. read from an export) with the columns the corpus build reads.
+
+    Absent columns are null. A Spoonacular export without the derived parsed_ingredients
+    and parsed_dish_types columns (like spoonacular.csv) gets them from ingredients and
+    dishTypes.
+    """
+    if source not in SOURCES:
+        raise ValueError(f'unknown source {source!r}; expected one of {SOURCES}')
+    id_column = SOURCE_ID_COLUMNS[source]
+    if id_column not in df.columns or df[id_column].isna().any():
+        raise ValueError(f'every {source} row needs an {id_column!r}')
+    df = df.copy()
+    if source == 'spoonacular':
+        if 'parsed_ingredients' not in df.columns and 'ingredients' in df.columns:
+            df['parsed_ingredients'] = df['ingredients'].map(parse_ingredients)
+        if 'parsed_dish_types' not in df.columns and 'dishTypes' in df.columns:
+            df['parsed_dish_types'] = df['dishTypes'].map(dish_type_words)
+    return df.reindex(columns=SOURCE_COLUMNS[source]).reset_index(drop=True)
+
+
+def next_sequence(directory):
+    sequences = [int(name.split('-', 1)[0]) for name in os.listdir(directory) if name[:8].isdigit()]
+    return max(sequences, default=0) + 1
+
+
+def append_recipes(base_dir, source, df):
+    """Add or update recipes of one source by writing them as a new delta segment; returns its path.
+
+    Rows are keyed by recipe id ('<source>:<id>'): a row whose id is already in the corpus
+    replaces that recipe. Nothing else is rewritten. The raw rows are kept next to the
+    compiled segment for `compact`, and get_corpus merges the segment on its next call.
+    """
+    raw_df = source_rows(source, df)
+    directory = os.path.join(base_dir, DELTAS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    with _append_lock:
+        # Claim a sequence number by creating the raw file; another process may race for it
+        while True:
+            raw_path = os.path.join(directory, f'{next_sequence(directory):08d}-{source}.parquet')
+            try:
+                os.close(os.open(raw_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                continue
+    tmp_path = f'{raw_path}.tmp-{os.getpid()}'
+    raw_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, raw_path)
+    # The compiled segment is what readers look for, so it is written last
+    segment_path = raw_path[:-len('.parquet')] + DELTA_SUFFIX
+    write_delta_segment(segment_path, source, raw_df)
+    return segment_path
+
+
+def conform(table, schema):
+    """table with exactly the columns of schema, cast to its types; absent columns are null."""
+    columns = [table.column(field.name).cast(field.type) if field.name in table.column_names
+               else pa.nulls(len(table), field.type) for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def merge_source(base_dir, source, raw_frames):
+    """Write the source file with the delta rows folded in, to a temporary path; returns that path.
+
+    Rows of the file whose recipe id was appended are dropped and the latest appended row
+    of each id is added at the end, which is the order Corpus.extended gives them.
+    """
+    path = os.path.join(base_dir, f'{source}.parquet')
+    base_table = pq.read_table(path)
+    delta_df = pd.concat(raw_frames, ignore_index=True)
+    delta_ids = recipe_ids(source, delta_df)
+    delta_df = delta_df[~delta_ids.duplicated(keep='last').to_numpy()]
+    superseded = recipe_ids(source, base_table.select([SOURCE_ID_COLUMNS[source]]).to_pandas()).isin(delta_ids)
+    merged = pa.concat_tables([
+        base_table.filter(pa.array(~superseded.to_numpy())),
+        conform(pa.Table.from_pandas(delta_df, preserve_index=False), base_table.schema),
+    ])
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    pq.write_table(merged, tmp_path)
+    return tmp_path
+
+
+def compact(base_dir):
+    """Fold the delta segments into the source files, the compiled corpus and the neighbor table.
+
+    Everything comes from the merged Corpus already in memory: no source row is parsed
+    again and no neighbor is recomputed. The result is the corpus a full build of the new
+    source files would give, in the same row order, except that neighbors tied at the
+    k-th score may be a different, equally similar row. Segments appended meanwhile stay
+    for the next run. Returns stats, or None when there was nothing to fold.
+    """
+    base_dir = os.path.abspath(base_dir)
+    with _compact_lock:
+        start_time = time.perf_counter()
+        corpus = get_corpus(base_dir)
+        if not corpus.segments:
+            return None
+        df = corpus.combined_df
+        live = np.ones(len(df), dtype=bool) if corpus.live is None else corpus.live
+        base_rows = int(corpus.details.starts[1])
+
+        # Rows in the order a build of the merged sources gives: per source, its remaining
+        # compiled rows and then its appended ones (which all come after the compiled rows)
+        sources = df['source'].to_numpy()
+        order = np.concatenate([np.flatnonzero(live & (sources == source)) for source in SOURCES])
+
+        raw_frames = {}
+        for path in corpus.segments:
+            raw_frames.setdefault(delta_source(path), []).append(pd.read_parquet(raw_delta_path(path)))
+        source_tmp_paths = {source: merge_source(base_dir, source, frames) for source, frames in raw_frames.items()}
+        hashes = {f'{source}.parquet': file_hash(source_tmp_paths.get(source, os.path.join(base_dir, f'{source}.parquet')))
+                  for source in SOURCES}
+
+        # From the builds this Corpus holds open, whatever has replaced the files since
+        tables = [segment.table(CORPUS_COLUMNS) for segment in corpus.details.segments]
+        table = pa.concat_tables(tables, promote_options='permissive').take(pa.array(order))
+        metadata = {
+            'schema_version': SCHEMA_VERSION,
+            'sources': hashes,
+            'built_at': datetime.now(timezone.utc).isoformat(),
+            'rows': len(order),
+            'compacted': {'segments': len(corpus.segments), 'delta_rows': len(df) - base_rows},
+        }
+        corpus_tmp_path = write_compiled(table, metadata, os.path.join(base_dir, COMPILED_CORPUS_FILE), replace=False)
+
+        # Sources first: if this stops halfway, the stale compiled corpus is rebuilt from
+        # them, and the segments still present are applied again on top, which is harmless
+        for source, tmp_path in source_tmp_paths.items():
+            os.replace(tmp_path, os.path.join(base_dir, f'{source}.parquet'))
+        os.replace(corpus_tmp_path, os.path.join(base_dir, COMPILED_CORPUS_FILE))
+        if corpus.neighbor_table is not None:
+            new_positions = np.full(len(df), -1, dtype=np.int64)
+            new_positions[order] = np.arange(len(order))
+            positions = corpus.neighbor_table.positions[order]
+            positions = np.where(positions >= 0, new_positions[positions], -1).astype(np.int32)
+            write_neighbor_table(os.path.join(base_dir, NEIGHBORS_FILE), positions,
+                                 corpus.neighbor_table.scores[order], metadata)
+        # Corpora still holding a segment keep reading it from their open file until they are
+        # released; only the name goes now
+        for path in corpus.segments:
+            os.remove(path)
+            os.remove(raw_delta_path(path))
+        return {'segments': len(corpus.segments), 'delta_rows': len(df) - base_rows, 'rows': len(order),
+                'seconds': time.perf_counter() - start_time}
+
+
+class Compactor:
+    """Background thread that runs `compact` every `interval` seconds once `min_segments` have piled up.
+
+    The compacted corpus is loaded in this thread too, so searches keep using the previous
+    one until it is ready; its detail files stay open (see CorpusDetails), so that Corpus
+    and results taken from it still read the files compaction replaced or removed.
+    """
+
+    def __init__(self, base_dir, interval=COMPACT_INTERVAL, min_segments=COMPACT_MIN_SEGMENTS):
+        self.base_dir = base_dir
+        self.interval = interval
+        self.min_segments = min_segments
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='deltas-compactor', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            if len(delta_segment_paths(self.base_dir)) < self.min_segments:
+                continue
+            try:
+                stats = compact(self.base_dir)
+                get_corpus(self.base_dir)
+            except (OSError, ValueError, RuntimeError, pa.ArrowException) as error:
+                print(f'Compaction failed: {error}', file=sys.stderr)
+                continue
+            if stats:
+                print(f"Compacted {stats['segments']} delta segments ({stats['delta_rows']} rows) "
+                      f"in {stats['seconds']:.2f}s")
+
+
+def read_export(path):
+    """New rows from a CSV or Parquet file."""
+    if path.endswith('.csv'):
+        return pd.read_csv(path)
+    return pd.read_parquet(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append recipes as delta segments, or fold the segments into the base.')
+    parser.add_argument('--base-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    commands = parser.add_subparsers(dest='command', required=True)
+    append = commands.add_parser('append', help='add or update recipes from a CSV or Parquet export of one source')
+    append.add_argument('source', choices=SOURCES)
+    append.add_argument('path')
+    commands.add_parser('compact', help='fold every delta segment into the source files and the compiled corpus')
+    commands.add_parser('status', help='list the delta segments')
+    args = parser.parse_args()
+
+    if args.command == 'append':
+        start = time.perf_counter()
+        path = append_recipes(args.base_dir, args.source, read_export(args.path))
+        print(f'Wrote {os.path.relpath(path, args.base_dir)} in {time.perf_counter() - start:.2f}s')
+    elif args.command == 'compact':
+        stats = compact(args.base_dir)
+        if stats is None:
+            print('No delta segments to compact')
+        else:
+            print(f"Folded {stats['segments']} segments ({stats['delta_rows']} rows) into {stats['rows']} rows "
+                  f"in {stats['seconds']:.2f}s")
+    else:
+        for path in delta_segment_paths(args.base_dir):
+            print(f'{os.path.basename(path)}: {pq.ParquetFile(path).metadata.num_rows} rows')
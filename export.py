@@ -0,0 +1,127 @@
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import argparse
+import json
+import os
+import time
+from profiling import stage
+
+# Rows per batch: details are read, converted and written one batch at a time
+EXPORT_BATCH_SIZE = 4096
+
+# Format (also the file extension) and its media type
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'jsonl': 'application/x-ndjson',
+}
+
+EXPORT_SCHEMA = pa.schema([
+    ('recipe_id', pa.string()),
+    ('source', pa.string()),
+    ('strMeal', pa.string()),
+    ('strCategory', pa.string()),
+    ('strArea', pa.string()),
+    ('strTags', pa.string()),
+    ('avg_rating', pa.float64()),
+    ('rating_count', pa.int64()),
+    ('ready_in_minutes', pa.float64()),
+    ('servings', pa.float64()),
+    ('price_per_serving', pa.float64()),
+    ('health_score', pa.float64()),
+    ('likes', pa.float64()),
+    ('isolated_ingredients', pa.string()),
+    ('ingredients', pa.string()),
+    ('strInstructions', pa.string()),
+    ('video_url', pa.string()),
+    ('strMealThumb', pa.string()),
+])
+# Added when the search has a pantry (see pantry.py)
+PANTRY_FIELDS = [pa.field('pantry_coverage', pa.float64()), pa.field('missing_ingredients', pa.string())]
+
+
+def export_schema(result):
+    if result.pantry is None:
+        return EXPORT_SCHEMA
+    return pa.schema(list(EXPORT_SCHEMA) + PANTRY_FIELDS)
+
+
+def export_batches(result, batch_size=EXPORT_BATCH_SIZE):
+    """The matches of a SearchResult as RecordBatches of at most batch_size rows.
+
+    Only one batch of detail columns is in memory at a time. Rows come in the display
+    order, as the search sorted them; each batch reads every detail row group it touches
+    once, though a row group shared by several batches is read again for each of them.
+    """
+    schema = export_schema(result)
+    corpus = result.corpus
+    df = result.df
+    for start in range(0, len(df), batch_size):
+        with stage('export.batch') as record:
+            batch_df = result.with_details(df.iloc[start:start + batch_size])
+            positions = corpus.combined_df.index.get_indexer(batch_df.index)
+            batch_df['isolated_ingredients'] = corpus.ingredient_lists.joined(positions)
+            if result.pantry is not None:
+                batch_df['missing_ingredients'] = batch_df['missing_ingredients'].str.join(', ')
+            batch = pa.RecordBatch.from_pandas(batch_df[schema.names], schema=schema, preserve_index=False)
+            record['rows'] = batch.num_rows
+        yield batch
+
+
+def write_export(result, sink, export_format, batch_size=EXPORT_BATCH_SIZE):
+    """Stream the matches of a SearchResult to sink (a path or binary file) as CSV, Parquet or JSON Lines.
+
+    Returns {'rows', 'batches', 'bytes', 'seconds', 'rows_per_second'}.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'unknown export format {export_format!r}; expected one of {list(EXPORT_FORMATS)}')
+    start_time = time.perf_counter()
+    schema = export_schema(result)
+    stream = open(sink, 'wb') if isinstance(sink, (str, os.PathLike)) else sink
+    start_offset = stream.tell() if stream.seekable() else 0
+    rows = batches = 0
+    try:
+        if export_format == 'parquet':
+            writer = pq.ParquetWriter(stream, schema)
+        elif export_format == 'csv':
+            writer = pa_csv.CSVWriter(stream, schema)
+        else:
+            writer = None
+        for batch in export_batches(result, batch_size):
+            if writer is not None:
+                writer.write_batch(batch)
+            else:
+                for record in batch.to_pylist():
+                    stream.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+            rows += batch.num_rows
+            batches += 1
+        if writer is not None:
+            writer.close()
+        stream.flush()
+        written = stream.tell() - start_offset if stream.seekable() else None
+    finally:
+        if stream is not sink:
+            stream.close()
+    elapsed = time.perf_counter() - start_time
+    return {'rows': rows, 'batches': batches, 'bytes': written, 'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else 0.0}
+
+
+if __name__ == '__main__':
+    from search_engine import SearchQuery, get_search_engine
+
+    parser = argparse.ArgumentParser(description='Export the matches of a search to CSV, Parquet or JSON Lines.')
+    parser.add_argument('output')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS),
+                        help='default: from the output file extension')
+    parser.add_argument('--query', default='{}', help='SearchQuery fields as JSON, e.g. \'{"ingredients_search": "garlic"}\'')
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    export_format = args.format or os.path.splitext(args.output)[1].lstrip('.')
+    engine = get_search_engine(os.path.dirname(os.path.abspath(__file__)))
+    result = engine.search(SearchQuery.from_dict(json.loads(args.query)))
+    stats = result.export(args.output, export_format, args.batch_size)
+    print(f"Wrote {stats['rows']} rows to {args.output} in {stats['batches']} batches, {stats['seconds']:.2f}s "
+          f"({stats['rows_per_second']:.0f} rows/s)")
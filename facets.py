@@ -0,0 +1,135 @@
+import numpy as np
+import copy
+import pandas as pd
+
+# Ingredient lexicons shared by every tab's dietary filters
+NON_VEGETARIAN_INGREDIENTS = r'\b(?:beef|pork|chicken|turkey|lamb|veal|venison|duck|goose|rabbit|bison|goat|ham|bacon|sausage|salami|pepperoni|prosciutto|anchovies|tuna|salmon|shrimp|crab|lobster|clams|mussels|oysters|scallops)\b'
+NON_KOSHER_INGREDIENTS = r'\b(?:shrimp|pork|ham|bacon|lobster|crab|clams|oysters|scallops|mussels|shellfish|catfish|eel|frog|octopus|squid|snail|caviar|sturgeon|Worcestershire Sauce)\b'
+MEAT_INGREDIENTS = r'\b(?:meat|beef|lamb|chicken|turkey|veal|venison|duck|goose|rabbit|bison|goat|sausage|salami|pepperoni|prosciutto|shrimp|crab|lobster|clams|mussels|oysters|scallops)\b'
+DAIRY_INGREDIENTS = r'\b(?:milk|cheese|yogurt|butter|sour cream)\b'
+# Plant milks, nut butters and the like, which DAIRY_INGREDIENTS would otherwise match
+PLANT_DAIRY_INGREDIENTS = (r'\b(?:(?:coconut|almond|soy|soya|oat|rice|cashew|hemp|vegan|non-dairy|dairy-free|plant-based)\s+'
+                           r'(?:milk|cheese|yogurt|butter)|(?:peanut|almond|cashew|nut|seed|sunflower|apple|cocoa|shea)\s+butter|'
+                           r'butter\s+beans?)\b')
+
+FACET_COLUMNS = ['is_vegetarian', 'has_nonkosher', 'mixes_meat_and_dairy', 'ingredient_count']
+
+# Map the num_ingredients options to their corresponding ranges
+INGREDIENT_RANGES = {
+    'Fewer (0-5)': (0, 5),
+    'Moderate (0-10)': (0, 10),
+    'More (0-100)': (0, 100)
+}
+
+
+# "Search by Region" options; each matches the tags like the region filter does
+AREAS = [
+    'American', 'British', 'Canadian', 'Chinese', 'Croatian', 'Dutch', 'Egyptian', 'Filipino', 'French', 'Greek',
+    'Indian', 'Irish', 'Italian', 'Jamaican', 'Japanese', 'Kenyan', 'Malaysian', 'Mexican', 'Moroccan', 'Polish',
+    'Portuguese', 'Russian', 'Spanish', 'Thai', 'Tunisian', 'Turkish', 'Ukrainian', 'Unknown', 'Vietnamese'
+]
+
+
+def category_pattern(category):
+    """The pattern a "Search by Category" option is matched with ('Snacks' also matches 'Snack')."""
+    return category.replace('Snacks', 'Snacks?')
+
+
+def compute_facets(ingredients):
+    """Dietary flags and ingredient count for each row of a numbered ingredients Series."""
+    ingredients = ingredients.fillna('')
+    return pd.DataFrame({
+        'is_vegetarian': ~ingredients.str.contains(NON_VEGETARIAN_INGREDIENTS, case=False),
+        'has_nonkosher': ingredients.str.contains(NON_KOSHER_INGREDIENTS, case=False),
+        'mixes_meat_and_dairy': (ingredients.str.contains(MEAT_INGREDIENTS, case=False) &
+                                 ingredients.str.contains(DAIRY_INGREDIENTS, case=False)),
+        'ingredient_count': ingredients.str.count('\n') + 1,
+    }, index=ingredients.index)
+
+
+def is_kosher(df):
+    return ~df['has_nonkosher'] & ~df['mixes_meat_and_dairy']
+
+
+def contains_mask(column, pattern):
+    """`column.str.contains(pattern, case=False, na=False)` as a bool array; categoricals match once per category."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Code -1 (missing) indexes the trailing False
+        category_matches = np.append(column.cat.categories.str.contains(pattern, case=False, na=False), False)
+        return category_matches[column.cat.codes.to_numpy()]
+    return column.str.contains(pattern, case=False, na=False).to_numpy(dtype=bool)
+
+
+def ingredient_count_mask(df, num_ingredients):
+    """Mask for the 'Number of Ingredients' option, or None when no range is selected."""
+    if num_ingredients not in INGREDIENT_RANGES:
+        return None
+    min_ingredients, max_ingredients = INGREDIENT_RANGES[num_ingredients]
+    return df['ingredient_count'].between(min_ingredients, max_ingredients)
+
+
+def pack(mask):
+    """A bool mask as a bitmap, eight rows per byte."""
+    return np.packbits(np.asarray(mask, dtype=bool))
+
+
+def append_bits(bitmaps, rows, more, more_rows):
+    """Packed (options x bytes) bitmaps of `rows` rows followed by those of `more_rows` further rows.
+
+    Only the bytes of `more` are shifted into place, so appending costs the size of the
+    addition rather than a repack of every row.
+    """
+    shift = rows % 8
+    bitmaps = bitmaps[:, :(rows + 7) // 8]
+    if not more_rows:
+        return bitmaps
+    if shift == 0:
+        return np.concatenate([bitmaps, more], axis=1)
+    more = more.astype(np.uint16)
+    following = np.concatenate([more[:, 1:], np.zeros((len(more), 1), dtype=np.uint16)], axis=1)
+    # The first bits of `more` fill the partial last byte; every other byte straddles two of its bytes
+    last = bitmaps[:, -1:] | (more[:, :1] >> shift)
+    shifted = ((more << (8 - shift)) | (following >> shift)) & 0xFF
+    appended = np.concatenate([bitmaps[:, :-1], last, shifted], axis=1)
+    return appended[:, :(rows + more_rows + 7) // 8].astype(np.uint8)
+
+
+class FacetIndex:
+    """Packed row bitmaps for every category, region and dietary option.
+
+    `counts` ANDs a bitmap of the rows passing the other filters with each option's
+    bitmap and pop-counts the result, so counting all options of a facet is one pass
+    over len(options) * rows / 8 bytes.
+    """
+
+    def __init__(self, df, categories, areas=AREAS):
+        self.rows = len(df)
+        self.categories = sorted(categories)
+        self.areas = list(areas)
+        # Which column a category matches depends on the meal search (see query.category_column)
+        self.category_bitmaps = {
+            column: np.stack([pack(contains_mask(df[column], category_pattern(category)))
+                              for category in self.categories])
+            for column in ['parsed_dish_types', 'strTags']
+        }
+        self.area_bitmaps = np.stack([pack(contains_mask(df['strTags'], area)) for area in self.areas])
+        self.dietary_bitmaps = np.stack([pack(df['is_vegetarian']), pack(is_kosher(df))])
+
+    def extend(self, df):
+        """A FacetIndex over this index's rows followed by the rows of df."""
+        added = FacetIndex(df, self.categories, self.areas)
+        index = copy.copy(self)
+        index.rows = self.rows + added.rows
+        index.category_bitmaps = {column: append_bits(bitmaps, self.rows, added.category_bitmaps[column], added.rows)
+                                  for column, bitmaps in self.category_bitmaps.items()}
+        index.area_bitmaps = append_bits(self.area_bitmaps, self.rows, added.area_bitmaps, added.rows)
+        index.dietary_bitmaps = append_bits(self.dietary_bitmaps, self.rows, added.dietary_bitmaps, added.rows)
+        return index
+
+    def all_rows(self):
+        return pack(np.ones(self.rows, dtype=bool))
+
+    @staticmethod
+    def counts(bitmaps, base):
+        """Rows set in both `base` and each row of `bitmaps`."""
+        return np.bitwise_count(bitmaps & base).sum(axis=1, dtype=np.int64)
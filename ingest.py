@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+import profiling
+from meals_tab import load_meals_data
+from recipes_tab import load_recipes_data
+from spoonacular_tab import load_spoonacular_data
+from utils import map_rows as serial_map_rows
+
+# Rows per task sent to the process pool
+CHUNK_SIZE = 64
+
+
+@contextmanager
+def timed(timings, name):
+    """Record the wall time of the block in timings[name] (seconds), and as a profiling stage."""
+    start = time.perf_counter()
+    try:
+        with profiling.stage(name):
+            yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+
+def _apply_chunk(args):
+    func, chunk = args
+    return [func(value) for value in chunk]
+
+
+class ChunkedMapper:
+    """Drop-in for `utils.map_rows` that parses rows in chunks across a process pool.
+
+    Chunks are submitted in order and their results concatenated in order, so the
+    output is identical to the serial map whatever the scheduling.
+    """
+
+    def __init__(self, executor, chunk_size=CHUNK_SIZE):
+        self.executor = executor
+        self.chunk_size = chunk_size
+
+    def __call__(self, func, values):
+        values = list(values)
+        chunks = [(func, values[start:start + self.chunk_size]) for start in range(0, len(values), self.chunk_size)]
+        results = []
+        for chunk_result in self.executor.map(_apply_chunk, chunks):
+            results.extend(chunk_result)
+        return results
+
+
+def load_sources(base_dir, workers=None, chunk_size=CHUNK_SIZE, timings=None):
+    """Run the three source loaders concurrently and return (meals_df, recipes_df, spoonacular_df).
+
+    The loaders' per-row parsing (recipe literals, Spoonacular instruction HTML) is split
+    into chunks across `workers` processes; with one worker everything runs in this process.
+    Wall time per loader and for the whole stage is recorded in `timings` when given.
+    """
+    timings = {} if timings is None else timings
+    workers = workers or os.cpu_count() or 1
+
+    def run(name, loader, *args):
+        with timed(timings, f'load_{name}'):
+            return loader(base_dir, *args)
+
+    def jobs(map_rows):
+        # The meals loader has no per-row parsing to spread out
+        return [('meals', load_meals_data), ('recipes', load_recipes_data, map_rows),
+                ('spoonacular', load_spoonacular_data, map_rows)]
+
+    with timed(timings, 'load_sources'):
+        if workers == 1:
+            return tuple(run(*job) for job in jobs(serial_map_rows))
+        with ProcessPoolExecutor(max_workers=workers) as processes, ThreadPoolExecutor(3) as threads:
+            futures = [profiling.submit(threads, run, *job) for job in jobs(ChunkedMapper(processes, chunk_size))]
+            return tuple(future.result() for future in futures)
+
+
+def format_timings(timings):
+    return '\n'.join(f'  {name:<20} {seconds * 1000:>9.1f} ms' for name, seconds in timings.items())
+
+
+if __name__ == '__main__':
+    # Usage: python ingest.py [workers ...]
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for workers in [int(arg) for arg in sys.argv[1:]] or [1, os.cpu_count() or 1]:
+        timings = {}
+        meals_df, recipes_df, spoonacular_df = load_sources(base_dir, workers=workers, timings=timings)
+        print(f'{workers} worker(s): {len(meals_df)} meals, {len(recipes_df)} recipes, '
+              f'{len(spoonacular_df)} spoonacular rows')
+        print(format_timings(timings))
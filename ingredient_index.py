@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import re
+
+TOKEN_PATTERN = r'\w+'
+WORD_TERM = re.compile(r'\w+')
+PHRASE_TERM = re.compile(r'\w+(?: \w+)+')
+
+
+def parse_ingredient_terms(ingredients_search):
+    """Split an ingredient query into terms; "quoted phrases" stay together."""
+    terms = re.findall(r'"(.*?)"|(\S+)', ingredients_search)
+    return [item[0] or item[1] for item in terms]
+
+
+def ingredient_term_pattern(term):
+    """Regex matching one ingredient term as a whole word, with an optional plural 's'."""
+    if ' ' in term:
+        return r'\b' + re.escape(term) + r's?\b'
+    return r'\b' + term + r's?\b'
+
+
+class IngredientIndex:
+    """Inverted index from lower-cased ingredient tokens to sorted arrays of row ids.
+
+    Single-word terms are answered from the posting lists alone. Phrases intersect the
+    posting lists of their words and then confirm the exact phrase on those candidates
+    only. Terms that use regex syntax fall back to a scan, so results always match
+    `str.contains(ingredient_term_pattern(term), case=False)` over the same text.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+        tokens = ingredients.str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+        codes, vocabulary = pd.factorize(tokens.to_numpy())
+        rows = tokens.index.to_numpy()
+
+        # Sort by (token, row), drop repeated tokens within a row and cut into posting lists
+        order = np.lexsort((rows, codes))
+        codes, rows = codes[order], rows[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])
+        codes, rows = codes[keep], rows[keep]
+        starts = np.flatnonzero(np.diff(codes)) + 1
+        first_codes = codes[np.r_[0, starts]] if len(codes) else codes
+        self.postings = dict(zip(vocabulary[first_codes], np.split(rows, starts)))
+        self._empty = rows[:0]
+
+    def extend(self, ingredients):
+        """A new index with the rows of `ingredients` added; their row ids must follow every existing one.
+
+        Only the new rows are tokenized, and only the posting lists of their tokens are copied.
+        """
+        added = IngredientIndex(ingredients)
+        index = IngredientIndex.__new__(IngredientIndex)
+        index.ingredients = pd.concat([self.ingredients, added.ingredients])
+        index.postings = dict(self.postings)
+        for token, rows in added.postings.items():
+            index.postings[token] = np.concatenate([self.postings[token], rows]) if token in self.postings else rows
+        index._empty = self._empty
+        return index
+
+    def token_rows(self, token):
+        # Fold the optional plural 's' of the query into a union of both posting lists
+        singular = self.postings.get(token, self._empty)
+        plural = self.postings.get(token + 's', self._empty)
+        if not len(plural):
+            return singular
+        if not len(singular):
+            return plural
+        return np.union1d(singular, plural)
+
+    def scan(self, term, rows=None):
+        ingredients = self.ingredients if rows is None else self.ingredients.loc[rows]
+        mask = ingredients.str.contains(ingredient_term_pattern(term), case=False, na=False)
+        return ingredients.index[mask.to_numpy()].to_numpy()
+
+    def term_rows(self, term, candidates=None):
+        lowered = term.lower()
+        if WORD_TERM.fullmatch(lowered):
+            return self.token_rows(lowered)
+        if PHRASE_TERM.fullmatch(lowered):
+            words = lowered.split(' ')
+            rows = self.token_rows(words[-1])
+            for word in words[:-1]:
+                rows = np.intersect1d(rows, self.postings.get(word, self._empty), assume_unique=True)
+            if candidates is not None:
+                rows = np.intersect1d(rows, candidates, assume_unique=True)
+            return self.scan(term, rows) if len(rows) else rows
+        return self.scan(term, candidates)
+
+    def estimate_rows(self, term):
+        """Upper bound on the rows matching term, from the posting lists alone (exact for single words)."""
+        lowered = term.lower()
+        if WORD_TERM.fullmatch(lowered):
+            return len(self.token_rows(lowered))
+        if PHRASE_TERM.fullmatch(lowered):
+            words = lowered.split(' ')
+            return min([len(self.token_rows(words[-1]))] + [len(self.postings.get(word, self._empty)) for word in words[:-1]])
+        return len(self.ingredients)
+
+    def search(self, terms):
+        """Row ids whose ingredients match every term, in ascending order."""
+        rows = None
+        # Indexed single words are cheapest and usually most selective, so apply them first
+        for term in sorted(terms, key=lambda t: WORD_TERM.fullmatch(t.lower()) is None):
+            term_rows = self.term_rows(term, rows)
+            rows = term_rows if rows is None else np.intersect1d(rows, term_rows, assume_unique=True)
+            if not len(rows):
+                break
+        return self.ingredients.index.to_numpy() if rows is None else rows
@@ -3,10 +3,20 @@ import pandas as pd
 import os
 import re
 from utils import search_bar
+from facets import compute_facets, is_kosher, category_pattern
+from profiling import stage
 
-def load_meals_data(base_dir):
+# Columns the corpus build reads from meals.parquet
+MEALS_COLUMNS = (['idMeal', 'strMeal', 'strCategory', 'strArea', 'strInstructions', 'strMealThumb', 'strTags', 'strYoutube',
+                  'strSource'] +
+                 [f'strIngredient{i}' for i in range(1, 21)] + [f'strMeasure{i}' for i in range(1, 21)])
+
+def load_meals_data(base_dir, columns=MEALS_COLUMNS):
+    """Read meals.parquet, only the given columns (None reads all of them)."""
     meals_parquet_file_path = os.path.join(base_dir, 'meals.parquet')
-    meals_df = pd.read_parquet(meals_parquet_file_path)
+    with stage('meals.read') as record:
+        meals_df = pd.read_parquet(meals_parquet_file_path, columns=columns)
+        record['rows'] = len(meals_df)
     return meals_df
 
 def combine_ingredients_and_measurements(row):
@@ -34,10 +44,11 @@ def display_meals_tab(meals_df, combined_categories):
     # Apply the function to the meals DataFrame
     meals_df['ingredients'] = meals_df.apply(combine_ingredients_and_measurements, axis=1)
     meals_df['isolated_ingredients'] = meals_df.apply(isolate_ingredients, axis=1)
+    meals_df = meals_df.join(compute_facets(meals_df['ingredients']))
 
     # Use the centralized search bar with a unique prefix
     search_results = search_bar(meals_df, combined_categories, prefix='meals_')
-    meal_search, category_search, area_search, tags_search, ingredients_search, vegetarian_filter, kosher_filter, margarine_for_butter, applesauce_for_oil, greek_yogurt_for_sour_cream, honey_for_sugar = search_results
+    meal_search, category_search, area_search, tags_search, ingredients_search, min_star_rating, vegetarian_filter, kosher_filter, active_substitutions, num_ingredients = search_results
 
     # Check if any search or filter values are provided
     if meal_search or category_search or area_search or tags_search or ingredients_search or vegetarian_filter or kosher_filter:
@@ -45,7 +56,7 @@ def display_meals_tab(meals_df, combined_categories):
         if meal_search:
             meals_df = meals_df[meals_df['strMeal'].str.contains(meal_search, case=False, na=False)]
         if category_search:
-            meals_df = meals_df[meals_df['strTags'].str.contains(category_search, case=False, na=False)]
+            meals_df = meals_df[meals_df['strTags'].str.contains(category_pattern(category_search), case=False, na=False)]
         if area_search:
             meals_df = meals_df[meals_df['strTags'].str.contains(area_search, case=False, na=False)]
         if tags_search:
@@ -61,10 +72,9 @@ def display_meals_tab(meals_df, combined_categories):
                 else:
                     meals_df = meals_df[meals_df['ingredients'].str.contains(ingredient, case=False, na=False)]
         if vegetarian_filter:
-            meals_df = meals_df[meals_df['strTags'].str.contains('Vegetarian', case=False, na=False)]
+            meals_df = meals_df[meals_df['is_vegetarian']]
         if kosher_filter:
-            meals_df = meals_df[~meals_df['ingredients'].str.contains('shrimp|pork', case=False, na=False)]
-            meals_df = meals_df[~((meals_df['ingredients'].str.contains('meat|beef|lamb|chicken', case=False, na=False)) & (meals_df['ingredients'].str.contains('milk|cheese|yogurt|butter|sour cream', case=False, na=False)))]
+            meals_df = meals_df[is_kosher(meals_df)]
 
         # Sort the DataFrame alphabetically by 'strMeal'
         meals_df = meals_df.sort_values(by='strMeal', ascending=True)
@@ -0,0 +1,209 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from similarity import SimilarityEngine, top_k
+from compact import InternedLists
+from profiling import stage
+
+NEIGHBORS_FILE = 'neighbors.parquet'
+METADATA_KEY = b'recipes_neighbors'
+DEFAULT_K = 3
+BLOCK_SIZE = 256
+
+_worker_engine = None
+
+
+def _init_worker(similarity_df):
+    global _worker_engine
+    _worker_engine = SimilarityEngine(similarity_df)
+
+
+def _top_k_block(args):
+    start, stop, k = args
+    return top_k_arrays(_worker_engine, np.arange(start, stop), k)
+
+
+def top_k_arrays(engine, query_positions, k):
+    """Top-k neighbors of the query positions as padded (rows x k) position and score arrays."""
+    positions = np.full((len(query_positions), k), -1, dtype=np.int32)
+    scores = np.full((len(query_positions), k), np.nan, dtype=np.float64)
+    for i, (top, top_scores) in enumerate(engine.top_k_positions(query_positions, k)):
+        positions[i, :len(top)] = top
+        scores[i, :len(top)] = top_scores
+    return positions, scores
+
+
+def compute_neighbors(similarity_df, k=DEFAULT_K, workers=None, block_size=BLOCK_SIZE):
+    """All-pairs top-k neighbors, evaluated in blocks of query rows across a process pool.
+
+    Returns (positions, scores, stats); the arrays are in row order regardless of how the
+    blocks were scheduled.
+    """
+    similarity_df = similarity_df[['strMeal', 'strMealThumb', 'isolated_ingredients']].reset_index(drop=True)
+    rows = len(similarity_df)
+    workers = workers or os.cpu_count() or 1
+    blocks = [(start, min(start + block_size, rows), k) for start in range(0, rows, block_size)]
+
+    start_time = time.perf_counter()
+    if workers == 1:
+        _init_worker(similarity_df)
+        results = [_top_k_block(block) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(similarity_df,)) as executor:
+            results = list(executor.map(_top_k_block, blocks))
+    elapsed = time.perf_counter() - start_time
+
+    positions = np.concatenate([p for p, _ in results]) if results else np.empty((0, k), dtype=np.int32)
+    scores = np.concatenate([s for _, s in results]) if results else np.empty((0, k))
+    stats = {'rows': rows, 'workers': workers, 'seconds': elapsed, 'rows_per_second': rows / elapsed if elapsed else 0.0}
+    return positions, scores, stats
+
+
+def write_neighbor_table(path, positions, scores, corpus_metadata):
+    k = positions.shape[1]
+    table = pa.table({
+        'row_id': pa.array(np.arange(len(positions), dtype=np.int32)),
+        'neighbor_ids': pa.FixedSizeListArray.from_arrays(pa.array(positions.ravel()), k),
+        'neighbor_scores': pa.FixedSizeListArray.from_arrays(pa.array(scores.ravel(), type=pa.float32()), k),
+    })
+    metadata = {
+        'k': k,
+        'corpus_built_at': corpus_metadata['built_at'],
+        'built_at': datetime.now(timezone.utc).isoformat(),
+    }
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return metadata
+
+
+def build_neighbor_table(base_dir, combined_df, corpus_metadata, k=DEFAULT_K, workers=None):
+    """Compute and persist the neighbor table for a freshly compiled corpus."""
+    positions, scores, stats = compute_neighbors(combined_df, k=k, workers=workers)
+    write_neighbor_table(os.path.join(base_dir, NEIGHBORS_FILE), positions, scores, corpus_metadata)
+    return stats
+
+
+class NeighborTable:
+    """Precomputed top-k similar items; a lookup is a row index into fixed-size arrays."""
+
+    def __init__(self, similarity_df, positions, scores, ingredient_lists=None):
+        if ingredient_lists is None:
+            ingredient_lists = InternedLists.from_joined(similarity_df['isolated_ingredients'])
+        self.df = similarity_df[['strMeal', 'strMealThumb']]
+        self.ingredient_lists = ingredient_lists
+        self.labels = similarity_df.index
+        self.positions = positions
+        self.scores = scores
+
+    def extend(self, engine, similarity_df, ingredient_lists, superseded=()):
+        """The table for the rows of `engine`: this table's rows followed by rows added since.
+
+        Instead of the all-pairs job, only the added rows are scored against every row.
+        That gives the added rows their own top-k, and it is also every score an existing
+        row can gain, since its other candidates were already ranked. An added row loses
+        ties to existing rows (it comes later), so merging keeps the order of a full
+        build. Existing rows that listed a row now `superseded` are recomputed in full.
+        """
+        rows, old_rows = len(engine.df), len(self.positions)
+        k = self.positions.shape[1]
+        positions = np.full((rows, k), -1, dtype=np.int32)
+        scores = np.full((rows, k), np.nan, dtype=np.float64)
+        positions[:old_rows], scores[:old_rows] = self.positions, self.scores
+
+        # Rows that listed a superseded row are recomputed in full at the end instead
+        stale = np.flatnonzero(np.isin(self.positions, superseded).any(axis=1))
+        if engine.dead is not None:
+            stale = np.setdiff1d(stale, engine.dead)
+        merging = np.ones(old_rows, dtype=bool)
+        merging[stale] = False
+
+        added = np.arange(old_rows, rows)
+        block_size = max(1, engine.max_block_cells // max(rows, 1))
+        for start in range(0, len(added), block_size):
+            block = added[start:start + block_size]
+            block_scores = engine.scores(block)
+            for position, row_scores in zip(block, block_scores):
+                top, top_scores = top_k(row_scores, k)
+                positions[position], scores[position] = -1, np.nan
+                positions[position, :len(top)], scores[position, :len(top)] = top, top_scores
+
+            # Existing rows where some added row may beat the current k-th neighbor (stored
+            # scores are float32, so this keeps near-ties too)
+            kth = np.nan_to_num(scores[:old_rows, k - 1], nan=-np.inf)
+            best = block_scores[:, :old_rows].max(axis=0)
+            gaining = np.flatnonzero(merging & np.isfinite(best) & (best.astype(np.float32) >= kth.astype(np.float32)))
+            if not len(gaining):
+                continue
+            # Rank with exact scores: the current neighbors' are recomputed pair by pair
+            current = positions[gaining]
+            listed = current >= 0
+            current_scores = np.full(current.shape, -np.inf)
+            current_scores[listed] = engine.pair_scores(np.repeat(gaining, listed.sum(axis=1)), current[listed])
+            candidate_scores = np.concatenate([current_scores, block_scores[:, gaining].T], axis=1)
+            candidate_positions = np.concatenate([positions[gaining], np.broadcast_to(block, (len(gaining), len(block)))],
+                                                 axis=1)
+            # Existing neighbors come first, so a stable sort hands them the ties
+            order = np.argsort(-candidate_scores, axis=1, kind='stable')[:, :k]
+            best_scores = np.take_along_axis(candidate_scores, order, axis=1)
+            best_positions = np.take_along_axis(candidate_positions, order, axis=1)
+            positions[gaining] = np.where(np.isfinite(best_scores), best_positions, -1)
+            scores[gaining] = np.where(np.isfinite(best_scores), best_scores, np.nan)
+
+        if len(stale):
+            stale_positions, stale_scores = top_k_arrays(engine, stale, k)
+            positions[stale], scores[stale] = stale_positions, stale_scores
+        return NeighborTable(similarity_df, positions, scores, ingredient_lists)
+
+    def top_similar(self, labels, k=DEFAULT_K):
+        """Same shape of result as `SimilarityEngine.top_similar`."""
+        top_items = []
+        with stage('similar_items.lookup', rows=len(labels)):
+            for position in self.labels.get_indexer(labels):
+                neighbors = self.positions[position, :k]
+                neighbors = neighbors[neighbors >= 0]
+                items = self.df.iloc[neighbors].assign(isolated_ingredients=self.ingredient_lists.joined(neighbors))
+                items.index = self.labels[neighbors]
+                top_items.append(items)
+        return top_items
+
+
+def load_neighbor_table(base_dir, combined_df, corpus_metadata, ingredient_lists=None):
+    """Load the neighbor table built for this corpus, or None if it is missing or stale."""
+    path = os.path.join(base_dir, NEIGHBORS_FILE)
+    try:
+        table = pq.read_table(path)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = json.loads((table.schema.metadata or {}).get(METADATA_KEY, b'{}'))
+    if metadata.get('corpus_built_at') != corpus_metadata.get('built_at') or table.num_rows != len(combined_df):
+        return None
+    k = metadata['k']
+    positions = table['neighbor_ids'].combine_chunks().flatten().to_numpy().reshape(-1, k)
+    scores = table['neighbor_scores'].combine_chunks().flatten().to_numpy().reshape(-1, k)
+    return NeighborTable(combined_df, positions, scores, ingredient_lists)
+
+
+if __name__ == '__main__':
+    import argparse
+    from corpus import load_corpus
+    from benchmark import scale_corpus
+
+    parser = argparse.ArgumentParser(description='Time the neighbor job for several worker counts.')
+    parser.add_argument('--rows', type=int, help='repeat the bundled corpus up to this many rows')
+    parser.add_argument('--workers', type=int, nargs='+', default=[os.cpu_count() or 1])
+    parser.add_argument('-k', type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    combined_df = load_corpus(os.path.dirname(os.path.abspath(__file__)), columns=None)
+    if args.rows:
+        combined_df = scale_corpus(combined_df, args.rows)
+    for workers in args.workers:
+        _, _, stats = compute_neighbors(combined_df, k=args.k, workers=workers)
+        print(f"{stats['rows']} rows, {stats['workers']} workers: {stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/s)")
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from facets import DAIRY_INGREDIENTS, PLANT_DAIRY_INGREDIENTS
+
+# Numeric fields of the corpus with range filters, and their labels. Spoonacular provides
+# them all; recipes provide the time, servings, price and likes (thumbs up); meals none.
+# Prices are in dollars per serving.
+NUMERIC_COLUMNS = {
+    'ready_in_minutes': 'Ready in (minutes)',
+    'servings': 'Servings',
+    'price_per_serving': 'Price per serving ($)',
+    'health_score': 'Health score',
+    'likes': 'Likes',
+}
+
+# Diet flags with filters. Spoonacular flags its own rows; dairy-free is derived from the
+# ingredients for the other sources, like the vegetarian facet, not counting plant milks
+# and nut butters as dairy.
+DIET_COLUMNS = {
+    'is_vegan': 'Vegan',
+    'is_gluten_free': 'Gluten Free',
+    'is_dairy_free': 'Dairy Free',
+}
+
+# The "Ready in" options and the most minutes each allows
+READY_IN_OPTIONS = {
+    'Under 15 minutes': 15,
+    'Under 30 minutes': 30,
+    'Under 45 minutes': 45,
+    'Under 1 hour': 60,
+    'Under 2 hours': 120,
+}
+
+
+def compute_numeric_fields(df):
+    """NUMERIC_COLUMNS (float32, NaN when unknown) and DIET_COLUMNS of combined rows.
+
+    df holds whatever of those columns its sources filled, and the numbered `ingredients`
+    the derived dairy-free flag is matched against.
+    """
+    fields = {}
+    for column in NUMERIC_COLUMNS:
+        values = df[column] if column in df.columns else pd.Series(np.nan, index=df.index)
+        fields[column] = pd.to_numeric(values, errors='coerce').astype(np.float32)
+    for column in DIET_COLUMNS:
+        fields[column] = (df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object))
+    ingredients = df['ingredients'].fillna('').str.replace(PLANT_DAIRY_INGREDIENTS, '', case=False, regex=True)
+    derived_dairy_free = ~ingredients.str.contains(DAIRY_INGREDIENTS, case=False)
+    fields['is_dairy_free'] = fields['is_dairy_free'].where(fields['is_dairy_free'].notna(), derived_dairy_free)
+    for column in DIET_COLUMNS:
+        fields[column] = fields[column].fillna(False).astype(bool)
+    return pd.DataFrame(fields, index=df.index)
+
+
+def is_bound(value):
+    return value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+
+
+def parse_ranges(ranges):
+    """Range filters as a sorted tuple of (column, low, high), either end None for open.
+
+    Accepts {column: [low, high]} (as JSON clients send it) or (column, low, high)
+    triples, each end a number or None. Ranges open at both ends are dropped; an unknown
+    column or a malformed range is a ValueError.
+    """
+    if isinstance(ranges, dict):
+        items = ranges.items()
+    elif isinstance(ranges, (list, tuple)) and all(isinstance(item, (list, tuple)) and item for item in ranges):
+        items = ((item[0], item[1:]) for item in ranges)
+    else:
+        raise ValueError('ranges must map columns to [low, high]')
+    parsed = {}
+    for column, bounds in items:
+        if column not in NUMERIC_COLUMNS:
+            raise ValueError(f'no range filter on {column!r}; expected one of {list(NUMERIC_COLUMNS)}')
+        if (not isinstance(bounds, (list, tuple)) or len(bounds) != 2
+                or not all(is_bound(value) for value in bounds)):
+            raise ValueError(f'range on {column!r} must be [low, high], each a number or null, not {bounds!r}')
+        low, high = (None if value is None else float(value) for value in bounds)
+        if low is not None or high is not None:
+            parsed[column] = (column, low, high)
+    return tuple(parsed[column] for column in sorted(parsed))
+
+
+def parse_diets(diets):
+    """Diet filters as a sorted tuple of DIET_COLUMNS names; an unknown one is a ValueError."""
+    if not isinstance(diets, (list, tuple)):
+        raise ValueError(f'diets must be a list of names, not {type(diets).__name__}')
+    for column in diets:
+        if column not in DIET_COLUMNS:
+            raise ValueError(f'no diet filter {column!r}; expected one of {list(DIET_COLUMNS)}')
+    return tuple(sorted(set(diets)))
+
+
+class NumericIndex:
+    """Row positions of one numeric column sorted by value, for range filters.
+
+    Rows without a value (NaN) are left out. A range is two binary searches into the
+    sorted values, so counting its rows is O(log n) and listing them O(log n + matches),
+    with no scan of the column.
+    """
+
+    def __init__(self, values):
+        self.column = np.asarray(values, dtype=np.float32)
+        known = np.flatnonzero(~np.isnan(self.column))
+        self.positions = known[np.argsort(self.column[known], kind='stable')]
+        self.values = self.column[self.positions]
+
+    def __len__(self):
+        return len(self.column)
+
+    def extend(self, values):
+        """A NumericIndex over this index's rows followed by `values`.
+
+        The added rows are sorted on their own and merged in, instead of re-sorting every row.
+        """
+        added = NumericIndex(values)
+        index = NumericIndex.__new__(NumericIndex)
+        index.column = np.concatenate([self.column, added.column])
+        # Equal values keep position order: the added rows go after the existing ones
+        insert_at = np.searchsorted(self.values, added.values, side='right')
+        index.positions = np.insert(self.positions, insert_at, added.positions + len(self))
+        index.values = np.insert(self.values, insert_at, added.values)
+        return index
+
+    def bounds(self, low=None, high=None):
+        """The slice of `positions` with low <= value <= high."""
+        start = 0 if low is None else int(np.searchsorted(self.values, np.float32(low), side='left'))
+        stop = len(self.values) if high is None else int(np.searchsorted(self.values, np.float32(high), side='right'))
+        return start, max(start, stop)
+
+    def count(self, low=None, high=None):
+        start, stop = self.bounds(low, high)
+        return stop - start
+
+    def rows(self, low=None, high=None):
+        """Positions with low <= value <= high, in ascending order."""
+        start, stop = self.bounds(low, high)
+        return np.sort(self.positions[start:stop])
+
+    def contains(self, positions, low=None, high=None):
+        """Which of the given positions have low <= value <= high."""
+        values = self.column[positions]
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= np.float32(low)
+        if high is not None:
+            mask &= values <= np.float32(high)
+        return mask
+
+    @property
+    def nbytes(self):
+        return self.column.nbytes + self.positions.nbytes + self.values.nbytes
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    from benchmark import best_time, scale_corpus
+    from corpus import load_corpus
+
+    parser = argparse.ArgumentParser(description='Time a range filter from the sorted index against a column scan.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--column', choices=list(NUMERIC_COLUMNS), default='ready_in_minutes')
+    parser.add_argument('--low', type=float)
+    parser.add_argument('--high', type=float, default=30)
+    args = parser.parse_args()
+
+    combined_df = load_corpus(os.path.dirname(os.path.abspath(__file__)))
+    for rows in args.rows:
+        column = scale_corpus(combined_df[[args.column]], rows)[args.column].to_numpy()
+        index = NumericIndex(column)
+        low = -np.inf if args.low is None else args.low
+        high = np.inf if args.high is None else args.high
+        scan_time, scanned = best_time(lambda: np.flatnonzero((column >= low) & (column <= high)))
+        index_time, found = best_time(lambda: index.rows(args.low, args.high))
+        assert np.array_equal(scanned, found)
+        print(f'{rows} rows: {len(found)} with {args.column} in [{args.low}, {args.high}]: '
+              f'scan {scan_time * 1000:.2f} ms, index {index_time * 1000:.2f} ms '
+              f'(count alone {best_time(lambda: index.count(args.low, args.high))[0] * 1e6:.1f} us)')
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import re
+from ingredient_index import IngredientIndex
+
+# Recipe ingredients a pantry may lack by default and still count as makeable
+DEFAULT_MAX_MISSING = 2
+
+
+def parse_pantry_items(pantry_search):
+    """Pantry items from comma- or newline-separated text, lower-cased and without repeats."""
+    items = (item.strip().lower() for item in re.split(r'[,\n]', pantry_search or ''))
+    return list(dict.fromkeys(item for item in items if item))
+
+
+def item_terms(item):
+    """Ingredient search terms matching a pantry item as plain text, singular or plural.
+
+    An ingredient term already takes an optional plural 's'; the item's own trailing 's'
+    or 'es' is dropped and an 'es' added, so "eggs" finds "egg" and "tomato" "tomatoes".
+    """
+    forms = [item, item + 'es']
+    if item.endswith('s'):
+        forms.append(item[:-1])
+    if item.endswith('es'):
+        forms.append(item[:-2])
+    # A term with a space is matched literally already (see ingredient_term_pattern)
+    return [form if ' ' in form else re.escape(form) for form in forms if form]
+
+
+class PantryCoverage:
+    """How much of every recipe one pantry covers.
+
+    `satisfied[i]` of the `sizes[i]` distinct ingredients of row i are in the pantry;
+    `have` marks the ingredient vocabulary entries the pantry satisfies.
+    """
+
+    def __init__(self, index, items, have, satisfied):
+        self.index = index
+        self.items = items
+        self.have = have
+        self.satisfied = satisfied
+
+    @property
+    def sizes(self):
+        return self.index.sizes
+
+    def missing(self):
+        return self.sizes - self.satisfied
+
+    @property
+    def nbytes(self):
+        return self.have.nbytes + self.satisfied.nbytes
+
+    def fraction(self):
+        return np.divide(self.satisfied, self.sizes, out=np.zeros(len(self.sizes)), where=self.sizes > 0)
+
+    def mask(self, max_missing=DEFAULT_MAX_MISSING):
+        """Rows the pantry covers but for at most max_missing ingredients (and at least one)."""
+        return (self.satisfied > 0) & (self.missing() <= max_missing)
+
+    def missing_ingredients(self, positions):
+        """Lower-cased ingredients each row at `positions` still needs."""
+        matrix = self.index.matrix
+        missing = []
+        for position in positions:
+            ids = matrix.indices[matrix.indptr[position]:matrix.indptr[position + 1]]
+            missing.append(sorted(self.index.vocabulary[ids[~self.have[ids].astype(bool)]]))
+        return missing
+
+
+class PantryIndex:
+    """Distinct lower-cased ingredients of every recipe, for ranking recipes by pantry coverage.
+
+    Reuses the similarity engine's binary recipe x ingredient matrix: the pantry becomes a
+    0/1 vector over the ingredient vocabulary and one sparse product counts, for every
+    recipe at once, how many of its ingredients the pantry has. A pantry item satisfies
+    every vocabulary entry it matches as plain text, singular or plural (see item_terms), as
+    whole words, looked up in a small inverted index over the vocabulary.
+    """
+
+    def __init__(self, engine, vocabulary_index=None):
+        self.matrix = engine.ingredient_matrix
+        self.sizes = engine.ingredient_sizes
+        self.vocabulary = engine.lower_vocabulary
+        if vocabulary_index is None:
+            vocabulary_index = IngredientIndex(pd.Series(self.vocabulary, dtype=object))
+        self.vocabulary_index = vocabulary_index
+
+    def extend(self, engine):
+        """The index for an engine extended from this one's (see SimilarityEngine.extend)."""
+        added = engine.lower_vocabulary[len(self.vocabulary):]
+        vocabulary_index = self.vocabulary_index
+        if len(added):
+            vocabulary_index = vocabulary_index.extend(
+                pd.Series(added, index=np.arange(len(self.vocabulary), len(engine.lower_vocabulary)), dtype=object))
+        return PantryIndex(engine, vocabulary_index)
+
+    def coverage(self, items):
+        have = np.zeros(self.matrix.shape[1], dtype=self.matrix.dtype)
+        for item in items:
+            for term in item_terms(item):
+                have[self.vocabulary_index.term_rows(term)] = 1
+        return PantryCoverage(self, items, have, (self.matrix @ have).astype(np.float64))
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    from benchmark import best_time, scale_corpus
+    from corpus import load_corpus
+    from similarity import SimilarityEngine
+
+    parser = argparse.ArgumentParser(description='Time pantry coverage over a scaled copy of the corpus.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--pantry', default='eggs, flour, milk, butter, sugar, salt, olive oil, garlic, onion, tomato, '
+                                            'chicken, rice')
+    parser.add_argument('--max-missing', type=int, default=DEFAULT_MAX_MISSING)
+    args = parser.parse_args()
+
+    combined_df = load_corpus(os.path.dirname(os.path.abspath(__file__)), columns=None)
+    items = parse_pantry_items(args.pantry)
+    for rows in args.rows:
+        df = scale_corpus(combined_df[['strMeal', 'strMealThumb', 'isolated_ingredients']], rows)
+        index = PantryIndex(SimilarityEngine(df))
+
+        def rank():
+            coverage = index.coverage(items)
+            matches = np.flatnonzero(coverage.mask(args.max_missing))
+            return matches[np.argsort(-coverage.fraction()[matches], kind='stable')]
+
+        elapsed, ranked = best_time(rank)
+        print(f'{rows} rows: {len(items)} pantry items, {len(ranked)} recipes within {args.max_missing} missing '
+              f'in {elapsed * 1000:.1f} ms')
@@ -0,0 +1,164 @@
+import pandas as pd
+import cProfile
+import contextvars
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Opt in with RECIPES_PROFILE=<mode> or ?profile=<mode>: 'timers' (or '1'), 'cprofile' or 'tracemalloc'
+PROFILE_ENV_VAR = 'RECIPES_PROFILE'
+PROFILE_QUERY_PARAM = 'profile'
+MODES = ['timers', 'cprofile', 'tracemalloc']
+# JSON lines destination; one line per profiled run
+PROFILE_LOG_ENV_VAR = 'RECIPES_PROFILE_LOG'
+PROFILE_LOG_FILE = 'profile.jsonl'
+# Functions and allocation sites kept from a cProfile or tracemalloc capture
+TOP_ENTRIES = 20
+
+_current = contextvars.ContextVar('profiler', default=None)
+# Nesting level of the current stage; per context, so stages timed in worker threads nest correctly
+_depth = contextvars.ContextVar('profiler_depth', default=0)
+_log_lock = threading.Lock()
+
+
+def requested_mode(query_params=None):
+    """The profiling mode asked for by the query params or the environment, or None."""
+    value = (query_params or {}).get(PROFILE_QUERY_PARAM) or os.environ.get(PROFILE_ENV_VAR, '')
+    value = value.strip().lower()
+    if value in ('', '0', 'false', 'off'):
+        return None
+    return value if value in MODES else 'timers'
+
+
+class Profiler:
+    """Stage timings (with row counts) of one run, plus an optional cProfile or tracemalloc capture.
+
+    tracemalloc is process-wide, so a capture also counts allocations made by other
+    sessions running at the same time; cProfile only sees the thread that started it.
+    """
+
+    def __init__(self, mode='timers', label=''):
+        self.mode = mode
+        self.label = label
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.stages = []
+        self.total_ms = None
+        self.top_functions = None
+        self.top_allocations = None
+        self.peak_traced_kib = None
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._profile = None
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the block; the yielded dict's 'rows' can be set once the row count is known."""
+        depth = _depth.get()
+        record = {'stage': name, 'depth': depth, 'rows': rows}
+        with self._lock:
+            self.stages.append(record)
+        token = _depth.set(depth + 1)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            _depth.reset(token)
+            record['start_ms'] = round((start - self._start) * 1000, 3)
+            record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    def start_capture(self):
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == 'tracemalloc' and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop_capture(self):
+        if self._profile is not None:
+            self._profile.disable()
+            stats = pstats.Stats(self._profile, stream=io.StringIO()).sort_stats('cumulative')
+            self.top_functions = [
+                {'function': f'{os.path.basename(filename)}:{line}({function})', 'calls': calls,
+                 'total_ms': round(total * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)}
+                for (filename, line, function), (_, calls, total, cumulative, _) in
+                sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_ENTRIES]
+            ]
+        elif self.mode == 'tracemalloc' and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.top_allocations = [
+                {'site': f'{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}',
+                 'kib': round(stat.size / 1024, 1), 'blocks': stat.count}
+                for stat in snapshot.statistics('lineno')[:TOP_ENTRIES]
+            ]
+            self.peak_traced_kib = round(peak / 1024, 1)
+
+    def frame(self):
+        """Stages in start order, indented by nesting, for display."""
+        stages = sorted(self.stages, key=lambda record: record.get('start_ms', 0))
+        return pd.DataFrame([{'stage': '  ' * record['depth'] + record['stage'], 'ms': record.get('ms'),
+                              'rows': record['rows']} for record in stages], columns=['stage', 'ms', 'rows'])
+
+    def to_dict(self):
+        data = {'run_id': self.run_id, 'label': self.label, 'mode': self.mode, 'started_at': self.started_at,
+                'total_ms': self.total_ms, 'stages': sorted(self.stages, key=lambda r: r.get('start_ms', 0))}
+        if self.top_functions is not None:
+            data['top_functions'] = self.top_functions
+        if self.top_allocations is not None:
+            data['top_allocations'] = self.top_allocations
+            data['peak_traced_kib'] = self.peak_traced_kib
+        return data
+
+
+def start(mode, label=''):
+    """Begin profiling the current context (e.g. one Streamlit rerun); returns the Profiler or None."""
+    if mode is None:
+        _current.set(None)
+        return None
+    profiler = Profiler(mode, label)
+    _current.set(profiler)
+    profiler.start_capture()
+    return profiler
+
+
+def finish(profiler, log_path=None):
+    """Stop profiling and append the run as one JSON line to log_path (if given)."""
+    _current.set(None)
+    if profiler is None:
+        return None
+    profiler.stop_capture()
+    profiler.total_ms = round((time.perf_counter() - profiler._start) * 1000, 3)
+    if log_path:
+        line = json.dumps(profiler.to_dict(), default=str)
+        with _log_lock, open(log_path, 'a') as f:
+            f.write(line + '\n')
+    return profiler
+
+
+def default_log_path(base_dir):
+    return os.environ.get(PROFILE_LOG_ENV_VAR) or os.path.join(base_dir, PROFILE_LOG_FILE)
+
+
+@contextmanager
+def stage(name, rows=None):
+    """A stage of the current profiled run; a no-op (yielding a scratch dict) when not profiling."""
+    profiler = _current.get()
+    if profiler is None:
+        yield {}
+        return
+    with profiler.stage(name, rows) as record:
+        yield record
+
+
+def submit(executor, func, *args):
+    """executor.submit that carries the current profiler into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, func, *args)
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+import time
+from facets import is_kosher, ingredient_count_mask, contains_mask, category_pattern
+from ingredient_index import parse_ingredient_terms
+from numeric_index import DIET_COLUMNS, NumericIndex
+from pantry import DEFAULT_MAX_MISSING
+from profiling import stage
+
+# Rows sampled to estimate the selectivity of a scan over a plain text column
+ESTIMATE_SAMPLE_SIZE = 256
+
+
+class Predicate:
+    """One filter of a search: an estimate of the rows it keeps and a mask over candidate positions.
+
+    `evaluate(positions)` returns a boolean array saying which of the given row positions
+    pass. `cost` is a relative per-row cost, used to break ties between equal estimates.
+    `facet` names the search_bar input the predicate comes from ('meal', 'category',
+    'area', 'vegetarian' or 'kosher'), for the facet counts. `rows`, when given, returns
+    the ascending positions that pass without looking at every row; the plan starts
+    from it when the predicate runs first.
+    """
+
+    def __init__(self, name, estimate, evaluate, cost=1.0, facet=None, rows=None):
+        self.name = name
+        self.estimate = estimate
+        self.evaluate = evaluate
+        self.cost = cost
+        self.facet = facet
+        self.rows = rows
+
+
+def mask_predicate(name, mask, facet=None):
+    """Predicate over a precomputed boolean mask; its estimate is exact."""
+    mask = np.asarray(mask, dtype=bool)
+    return Predicate(name, int(mask.sum()), lambda positions: mask[positions], cost=0.0, facet=facet)
+
+
+def contains_predicate(name, column, pattern, facet=None):
+    """`column.str.contains(pattern, case=False, na=False)` as a predicate.
+
+    Categorical columns are matched once per category, which makes the estimate exact.
+    Plain text columns are estimated from a sample and scanned only over the candidates.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return mask_predicate(name, contains_mask(column, pattern), facet)
+
+    def evaluate(positions):
+        return contains_mask(column.iloc[positions], pattern)
+
+    sample = np.unique(np.linspace(0, len(column) - 1, min(ESTIMATE_SAMPLE_SIZE, len(column))).astype(np.int64))
+    estimate = int(round(evaluate(sample).mean() * len(column))) if len(sample) else 0
+    return Predicate(name, estimate, evaluate, cost=10.0, facet=facet)
+
+
+def range_predicate(numeric_index, column, low=None, high=None):
+    """low <= column <= high (None for an open end) from a NumericIndex; the estimate is exact.
+
+    Run first, it lists its rows by binary search; after other predicates it checks the
+    values of the remaining candidates only.
+    """
+    bounds = [f'>= {low:g}'] if low is not None else []
+    bounds += [f'<= {high:g}'] if high is not None else []
+    return Predicate(f"{column} {' and '.join(bounds)}", numeric_index.count(low, high),
+                     lambda positions: numeric_index.contains(positions, low, high), cost=0.0,
+                     rows=lambda: numeric_index.rows(low, high))
+
+
+def ingredient_predicate(ingredient_index, labels, term):
+    """One ingredient term, answered from the inverted index (see `IngredientIndex.term_rows`)."""
+
+    def evaluate(positions):
+        candidates = labels[positions]
+        return np.isin(candidates, ingredient_index.term_rows(term, candidates), assume_unique=True)
+
+    return Predicate(f'ingredient {term!r}', ingredient_index.estimate_rows(term), evaluate, cost=0.5)
+
+
+class QueryPlan:
+    """Predicates of one search, evaluated cheapest-first over a shrinking set of row positions.
+
+    Predicates run in order of estimated result size (then cost), each one only over the
+    rows that passed the previous ones; evaluation stops as soon as no row is left. The
+    first one starts from its own rows when it can list them (see Predicate.rows).
+    """
+
+    def __init__(self, predicates, row_count, notes=None):
+        self.predicates = sorted(predicates, key=lambda predicate: (predicate.estimate, predicate.cost))
+        self.row_count = row_count
+        # Anything planning wants to tell the user, e.g. {'fuzzy_titles': [...]}
+        self.notes = notes or {}
+        self.steps = []
+
+    def execute(self):
+        """Row positions that pass every predicate, in ascending order."""
+        positions = np.arange(self.row_count)
+        self.steps = []
+        for step, predicate in enumerate(self.predicates):
+            rows_in = len(positions)
+            start = time.perf_counter()
+            if rows_in:
+                with stage(f'filter {predicate.name}', rows=rows_in):
+                    if step == 0 and predicate.rows is not None:
+                        positions = predicate.rows()
+                    else:
+                        positions = positions[predicate.evaluate(positions)]
+            self.steps.append({
+                'predicate': predicate.name,
+                'estimated_rows': predicate.estimate,
+                'rows_in': rows_in,
+                'rows_out': len(positions),
+                'ms': (time.perf_counter() - start) * 1000,
+                'skipped': not rows_in,
+            })
+        return positions
+
+    def explain(self):
+        """One row per predicate in evaluation order, with its estimate, cardinalities and time."""
+        columns = ['predicate', 'estimated_rows', 'rows_in', 'rows_out', 'ms', 'skipped']
+        if not self.steps:
+            return pd.DataFrame([{'predicate': p.name, 'estimated_rows': p.estimate} for p in self.predicates],
+                                columns=columns)
+        return pd.DataFrame(self.steps, columns=columns).round({'ms': 3})
+
+
+def title_predicate(title_index, meal_search, plan_notes, live=None):
+    """Title search through the trigram index; the matches are exact, so is the estimate.
+
+    When no title contains meal_search, the closest titles by trigram similarity are used
+    instead and listed, best first, in plan_notes['fuzzy_titles'] (only rows in `live`).
+    """
+    matches = title_index.search(meal_search)
+    name = f'meal {meal_search!r}'
+    if not len(matches):
+        matches, _ = title_index.fuzzy(meal_search)
+        if live is not None:
+            matches = matches[live[matches]]
+        plan_notes['fuzzy_titles'] = title_index.titles.iloc[matches].tolist()
+        matches = np.sort(matches)
+        name = f'meal ~{meal_search!r}'
+    mask = np.zeros(len(title_index), dtype=bool)
+    mask[matches] = True
+    return mask_predicate(name, mask, facet='meal')
+
+
+def category_column(df, meal_mask=None):
+    """Column the category filter matches: Spoonacular's dish types whenever a Spoonacular
+    row is among the rows matching the meal search (all rows without one), the tags otherwise.
+    """
+    is_spoonacular = (df['source'] == 'spoonacular').to_numpy(dtype=bool)
+    if meal_mask is not None:
+        is_spoonacular = is_spoonacular & meal_mask
+    return 'parsed_dish_types' if is_spoonacular.any() else 'strTags'
+
+
+def plan_search(df, ingredient_index, meal_search='', category_search='', area_search='', tags_search='',
+                ingredients_search='', vegetarian_filter=False, kosher_filter=False, num_ingredients='',
+                title_index=None, live=None, pantry=None, max_missing=DEFAULT_MAX_MISSING, numeric_indexes=None,
+                ranges=(), diets=()):
+    """Compile the `search_bar` values into a QueryPlan over the rows of df.
+
+    Matches the sequential filters main.py used to apply one after another, except that
+    with a `title_index` a meal search that matches no title falls back to fuzzy matches.
+    category_search is a "Search by Category" option, matched with its category_pattern
+    as FacetIndex counts it. The minimum star rating is not part of the plan: it needs
+    the ratings joined onto the result. Rows outside the `live` mask (recipes superseded
+    by a newer version, see Corpus.live) are left out. With a `pantry` (PantryCoverage),
+    only recipes it covers but for at most max_missing ingredients are kept. `ranges` are
+    (column, low, high) filters on NUMERIC_COLUMNS, answered from `numeric_indexes`
+    (NumericIndex by column) when given and by comparing df's column otherwise; `diets`
+    are DIET_COLUMNS flags every row must have.
+    """
+    predicates = []
+    notes = {}
+    if meal_search:
+        if title_index is not None:
+            meal_predicate = title_predicate(title_index, meal_search, notes, live)
+        else:
+            meal_predicate = contains_predicate(f'meal {meal_search!r}', df['strMeal'], meal_search, facet='meal')
+        predicates.append(meal_predicate)
+    if category_search:
+        # Category matches the dish types or the tags depending on the meal matches (as the
+        # sequential filter did), so evaluate those once over every row (for an indexed
+        # title search that is just its precomputed mask)
+        meal_mask = None
+        if meal_search:
+            meal_mask = meal_predicate.evaluate(np.arange(len(df)))
+            predicates[-1] = mask_predicate(meal_predicate.name, meal_mask, facet='meal')
+        column = category_column(df, meal_mask)
+        predicates.append(contains_predicate(f'category {category_search!r}', df[column],
+                                             category_pattern(category_search), facet='category'))
+    if area_search:
+        predicates.append(contains_predicate(f'area {area_search!r}', df['strTags'], area_search, facet='area'))
+    for tag in tags_search.split():
+        predicates.append(contains_predicate(f'tag {tag!r}', df['strTags'], tag))
+    for term in parse_ingredient_terms(ingredients_search):
+        predicates.append(ingredient_predicate(ingredient_index, df.index.to_numpy(), term))
+    if vegetarian_filter:
+        predicates.append(mask_predicate('vegetarian', df['is_vegetarian'], facet='vegetarian'))
+    if kosher_filter:
+        predicates.append(mask_predicate('kosher', is_kosher(df), facet='kosher'))
+    ingredient_count_filter = ingredient_count_mask(df, num_ingredients)
+    if ingredient_count_filter is not None:
+        predicates.append(mask_predicate(f'ingredients {num_ingredients}', ingredient_count_filter))
+    for column, low, high in ranges:
+        if numeric_indexes is not None:
+            predicates.append(range_predicate(numeric_indexes[column], column, low, high))
+        else:
+            predicates.append(range_predicate(NumericIndex(df[column]), column, low, high))
+    for column in diets:
+        predicates.append(mask_predicate(DIET_COLUMNS[column].lower(), df[column]))
+    if pantry is not None:
+        predicates.append(mask_predicate(f'pantry of {len(pantry.items)}, at most {max_missing} missing',
+                                         pantry.mask(max_missing)))
+    if live is not None:
+        predicates.append(mask_predicate('current version', live))
+    return QueryPlan(predicates, len(df), notes)
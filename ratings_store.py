@@ -0,0 +1,119 @@
+import pandas as pd
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+RATINGS_DB_FILE = 'ratings.db'
+LEGACY_RATINGS_FILE = 'ratings.json'
+
+# Weight of the global mean in the Bayesian average, in number of ratings
+BAYESIAN_PRIOR_COUNT = 5
+
+
+class RatingsStore:
+    """Star ratings per meal in SQLite (WAL mode), safe to share between sessions and processes.
+
+    Every rating is a single atomic upsert, so concurrent submissions add up instead of
+    overwriting each other. A version counter is bumped in the same transaction, which
+    lets readers cache the aggregated ratings until something changes.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self._frame_lock = threading.Lock()
+        self._frame_cache = (None, None)
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS ratings '
+                               '(meal TEXT PRIMARY KEY, total INTEGER NOT NULL, count INTEGER NOT NULL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', 0)")
+        if legacy_path is not None:
+            self.migrate_json(legacy_path)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per transaction; commits on success, rolls back on error
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def migrate_json(self, legacy_path):
+        """One-time import of a ratings.json file ({meal: {"total", "count"}})."""
+        with self._connect() as connection:
+            # Take the write lock first so concurrent processes cannot both migrate
+            connection.execute('BEGIN IMMEDIATE')
+            migrated = connection.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+            if migrated or not os.path.exists(legacy_path):
+                return
+            with open(legacy_path, 'r') as f:
+                ratings = json.load(f)
+            connection.executemany(
+                'INSERT INTO ratings VALUES (?, ?, ?) ON CONFLICT(meal) DO UPDATE SET '
+                'total = total + excluded.total, count = count + excluded.count',
+                [(meal, rating['total'], rating['count']) for meal, rating in ratings.items()]
+            )
+            connection.execute("INSERT INTO meta VALUES ('migrated_json', 1)")
+            connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def add_rating(self, meal, stars):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO ratings VALUES (?, ?, 1) ON CONFLICT(meal) DO UPDATE SET '
+                'total = total + excluded.total, count = count + 1',
+                (meal, stars)
+            )
+            connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def version(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def ratings_frame(self):
+        """Aggregated ratings indexed by meal name, ready to join onto the corpus on strMeal."""
+        version = self.version()
+        with self._frame_lock:
+            cached_version, frame = self._frame_cache
+            if cached_version == version:
+                return frame
+        with self._connect() as connection:
+            frame = pd.read_sql_query('SELECT meal, total AS rating_total, count AS rating_count FROM ratings',
+                                      connection, index_col='meal')
+        frame.index.name = 'strMeal'
+        frame['avg_rating'] = (frame['rating_total'] / frame['rating_count']).where(frame['rating_count'] > 0, 0.0)
+        total_count = frame['rating_count'].sum()
+        global_mean = frame['rating_total'].sum() / total_count if total_count else 0.0
+        frame['bayesian_rating'] = ((BAYESIAN_PRIOR_COUNT * global_mean + frame['rating_total']) /
+                                    (BAYESIAN_PRIOR_COUNT + frame['rating_count']))
+        # Unrated meals rank at the prior, i.e. the global mean
+        frame.attrs['prior_rating'] = global_mean
+        with self._frame_lock:
+            self._frame_cache = (version, frame)
+        return frame
+
+    def join_ratings(self, df):
+        """Add the rating columns to df in one join; unrated meals get zero ratings."""
+        ratings = self.ratings_frame()
+        fill_values = {'rating_total': 0, 'rating_count': 0, 'avg_rating': 0.0,
+                       'bayesian_rating': ratings.attrs.get('prior_rating', 0.0)}
+        # Counts stay integers whether or not any row needed filling
+        return df.join(ratings, on='strMeal').fillna(fill_values).astype({'rating_total': 'int64', 'rating_count': 'int64'})
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_ratings_store(base_dir):
+    """Process-wide RatingsStore for base_dir, migrating ratings.json on first use."""
+    base_dir = os.path.abspath(base_dir)
+    with _stores_lock:
+        if base_dir not in _stores:
+            _stores[base_dir] = RatingsStore(os.path.join(base_dir, RATINGS_DB_FILE),
+                                             legacy_path=os.path.join(base_dir, LEGACY_RATINGS_FILE))
+        return _stores[base_dir]
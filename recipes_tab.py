@@ -1,10 +1,33 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import ast
 import os
-from utils import parse_instructions, parse_ingredients_and_measurements, extract_ingredients
+from utils import map_rows as serial_map_rows
+from profiling import stage
 
-def load_recipes_data(base_dir):
+# Columns the corpus build reads from recipes.parquet: display and search fields, the
+# nested sections and instructions, and the numeric fields kept for filtering
+RECIPES_COLUMNS = [
+    'id', 'name', 'description', 'thumbnail_url', 'tags', 'country', 'keywords', 'inspired_by_url',
+    'original_video_url', 'instructions', 'sections', 'total_time_minutes', 'num_servings', 'price', 'user_ratings'
+]
+
+
+def load_recipes_data(base_dir, map_rows=serial_map_rows, columns=RECIPES_COLUMNS):
+    """Read recipes.parquet (only the given columns; None reads all) and parse its nested columns."""
     recipes_parquet_file_path = os.path.join(base_dir, 'recipes.parquet')
-    recipes_df = pd.read_parquet(recipes_parquet_file_path)
+    with stage('recipes.read') as record:
+        recipes_table = pq.read_table(recipes_parquet_file_path, columns=columns)
+        record['rows'] = recipes_table.num_rows
+    return parse_recipes_table(recipes_table, map_rows)
+
+
+def parse_recipes_table(recipes_table, map_rows=serial_map_rows):
+    """Rename and parse recipes rows (an Arrow table with the columns of recipes.parquet)."""
+    recipes_df = recipes_table.to_pandas()
 
     # Map columns from recipes_df to match meals_df
     recipes_df = recipes_df.rename(columns={
@@ -18,19 +41,161 @@ def load_recipes_data(base_dir):
         'original_video_url': 'original_video_url'  # Correctly map the original_video_url column
     })
 
-    # Convert sections column to string for display
-    recipes_df['sections'] = recipes_df['sections'].astype(str)
-
     # Parse instructions
-    recipes_df['parsed_instructions'] = recipes_df['instructions'].apply(parse_instructions)
+    with stage('recipes.parse_instructions', rows=len(recipes_df)):
+        recipes_df['parsed_instructions'] = flatten_instructions(read_nested_column(recipes_table, 'instructions', map_rows))
 
-    # Parse ingredients and measurements
-    recipes_df['parsed_ingredients'] = recipes_df['sections'].apply(parse_ingredients_and_measurements)
-
-    # Extract ingredients for search
-    recipes_df['search_ingredients'] = recipes_df['sections'].apply(extract_ingredients)
+    # Parse ingredients and measurements, and extract ingredients for search
+    with stage('recipes.parse_sections', rows=len(recipes_df)):
+        parsed_ingredients, search_ingredients = flatten_sections(read_nested_column(recipes_table, 'sections', map_rows))
+    recipes_df['parsed_ingredients'] = parsed_ingredients
+    recipes_df['search_ingredients'] = search_ingredients
 
     # Use search_ingredients for isolated_ingredients
     recipes_df['isolated_ingredients'] = recipes_df['search_ingredients']
 
-    return recipes_df
\ No newline at end of file
+    # Numeric fields under the corpus names (see numeric_index.py); a zero time or serving count means unknown
+    recipes_df['ready_in_minutes'] = pd.to_numeric(recipes_df['total_time_minutes'], errors='coerce').replace(0, np.nan)
+    recipes_df['servings'] = pd.to_numeric(recipes_df['num_servings'], errors='coerce').replace(0, np.nan)
+    recipes_df['price_per_serving'] = literal_number(recipes_df['price'], 'portion') / 100
+    recipes_df['likes'] = literal_number(recipes_df['user_ratings'], 'count_positive')
+
+    return recipes_df
+
+
+def literal_number(values, key):
+    """The number stored under key in each dict literal string (e.g. "{'portion': 250, ...}"), or NaN."""
+    return pd.to_numeric(values.astype(str).str.extract(rf"'{key}':\s*(-?[0-9.]+)", expand=False), errors='coerce')
+
+
+def parse_literal_list(value):
+    try:
+        parsed = ast.literal_eval(value)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+    return parsed if isinstance(parsed, list) else None
+
+
+def read_nested_column(table, name, map_rows=serial_map_rows):
+    """Return a column as a native Arrow list array.
+
+    The bundled recipes.parquet stores `sections` and `instructions` as Python-literal
+    strings; those are parsed once with ast.literal_eval, which never executes code.
+    Values that are not a list become null. Columns already stored as nested Parquet
+    types are returned as they are.
+    """
+    column = table.column(name).combine_chunks()
+    if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        return column
+    return pa.array(map_rows(parse_literal_list, column.to_pylist()))
+
+
+def to_numpy(values):
+    return values.to_numpy(zero_copy_only=False)
+
+
+def field(values, name):
+    """A struct array's child field; an absent field reads as all null."""
+    if not pa.types.is_struct(values.type) or name not in [child.name for child in values.type]:
+        return pa.nulls(len(values))
+    return pc.struct_field(values, name)
+
+
+def flatten_lists(lists):
+    """Flatten one level of a list array.
+
+    Returns the child values, the index of the list each value came from, and its position
+    within that list.
+    """
+    if not pa.types.is_list(lists.type):
+        # Every value was null, so Arrow could not infer a list type
+        return pa.nulls(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lengths = to_numpy(pc.fill_null(pc.list_value_length(lists), 0)).astype(np.int64)
+    values = pc.list_flatten(lists)
+    parents = to_numpy(pc.list_parent_indices(lists)).astype(np.int64)
+    starts = np.cumsum(lengths) - lengths
+    return values, parents, np.arange(len(values)) - starts[parents]
+
+
+def rows_with(parents, flags, row_count):
+    """Mask of the rows that have at least one flagged child value."""
+    mask = np.zeros(row_count, dtype=bool)
+    mask[parents[np.asarray(flags, dtype=bool)]] = True
+    return mask
+
+
+def as_text(values):
+    # None prints as 'None' in the f-strings of the row-wise parsers in utils.py
+    return pd.Series(values, dtype=object).fillna('None').astype(str)
+
+
+def join_lines(lines, parents, row_count, separator):
+    """Join each row's strings (given in row order) into one string per row."""
+    counts = np.bincount(parents, minlength=row_count)
+    offsets = pa.array(np.concatenate([[0], np.cumsum(counts)]).astype(np.int32))
+    joined = pc.binary_join(pa.ListArray.from_arrays(offsets, pa.array(lines, type=pa.string())), separator)
+    return to_numpy(joined).astype(object)
+
+
+def flatten_sections(sections):
+    """Vectorized `parse_ingredients_and_measurements` and `extract_ingredients`.
+
+    Works on a list<struct> array of recipe sections and returns two object arrays,
+    (parsed_ingredients, search_ingredients). Rows whose data would make the row-wise
+    parsers raise (a null section, component or ingredient, a component without
+    measurements or unit, a missing ingredient name for the search list) get ''.
+    """
+    row_count = len(sections)
+    section_values, section_rows, _ = flatten_lists(sections)
+    components = field(section_values, 'components')
+    component_values, component_sections, positions = flatten_lists(components)
+    component_rows = section_rows[component_sections]
+    ingredient = field(component_values, 'ingredient')
+
+    broken = to_numpy(pc.is_null(sections)).astype(bool)
+    broken |= rows_with(section_rows, to_numpy(pc.is_null(section_values)), row_count)
+    broken |= rows_with(section_rows, to_numpy(pc.is_null(components)), row_count)
+    broken |= rows_with(component_rows, to_numpy(pc.is_null(component_values)), row_count)
+    broken |= rows_with(component_rows, to_numpy(pc.is_null(ingredient)), row_count)
+
+    # extract_ingredients: comma-separated ingredient names
+    names = to_numpy(field(ingredient, 'display_singular'))
+    search_ingredients = join_lines(pd.Series(names, dtype=object).fillna(''), component_rows, row_count, ', ')
+    search_ingredients[broken | rows_with(component_rows, pd.isna(names), row_count)] = ''
+
+    # parse_ingredients_and_measurements only reads the first measurement of each component
+    first_measurements = pc.list_slice(field(component_values, 'measurements'), 0, 1)
+    measurement_values, measured_components, _ = flatten_lists(first_measurements)
+    unit = field(measurement_values, 'unit')
+    measured = np.zeros(len(component_values), dtype=bool)
+    measured[measured_components] = True
+    broken |= rows_with(component_rows, ~measured, row_count)
+    broken |= rows_with(component_rows[measured_components], to_numpy(pc.is_null(measurement_values)), row_count)
+    broken |= rows_with(component_rows[measured_components], to_numpy(pc.is_null(unit)), row_count)
+
+    quantities = np.full(len(component_values), None, dtype=object)
+    quantities[measured_components] = to_numpy(field(measurement_values, 'quantity'))
+    units = np.full(len(component_values), None, dtype=object)
+    units[measured_components] = to_numpy(field(unit, 'display_singular'))
+    units = pd.Series(units, dtype=object)
+    has_unit = units.notna() & (units.fillna('') != '')
+
+    lines = (pd.Series(positions + 1).astype(str) + '. ' + as_text(quantities) + ' ' +
+             (units.fillna('').astype(str) + ' of ').where(has_unit, '') +
+             as_text(names) + ' ' + as_text(to_numpy(field(component_values, 'extra_comment')))).str.strip()
+    parsed_ingredients = join_lines(lines, component_rows, row_count, '\n')
+    parsed_ingredients[broken] = ''
+    return parsed_ingredients, search_ingredients
+
+
+def flatten_instructions(instructions):
+    """Vectorized `parse_instructions` over a list<struct> array of instruction steps."""
+    row_count = len(instructions)
+    step_values, step_rows, positions = flatten_lists(instructions)
+    broken = to_numpy(pc.is_null(instructions)).astype(bool)
+    broken |= rows_with(step_rows, to_numpy(pc.is_null(step_values)), row_count)
+
+    lines = pd.Series(positions + 1).astype(str) + '. ' + as_text(to_numpy(field(step_values, 'display_text')))
+    parsed_instructions = join_lines(lines, step_rows, row_count, '\n')
+    parsed_instructions[broken] = ''
+    return parsed_instructions
\ No newline at end of file
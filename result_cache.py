@@ -0,0 +1,138 @@
+import pandas as pd
+import threading
+import time
+from collections import OrderedDict
+from ingredient_index import parse_ingredient_terms
+from pantry import parse_pantry_items
+from numeric_index import parse_ranges, parse_diets
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 << 20
+DEFAULT_TTL = 600
+
+
+def fold_pattern(pattern):
+    # The filters match case-insensitively, but a backslash escape's case is part of its meaning
+    return pattern if '\\' in pattern else pattern.lower()
+
+
+def query_key(query, min_stars=0):
+    """A hashable key equal for every SearchQuery with the same ordered results.
+
+    Text is case-folded (see fold_pattern), the AND-ed tag, ingredient and pantry terms, ranges and diets
+    are sorted and de-duplicated, and inputs left at their defaults are dropped.
+    Substitutions only change how a page is displayed, so they are not part of the key.
+    `min_stars` is the numeric minimum rating the query's star string stands for.
+    """
+    fields = {
+        'meal': fold_pattern(query.meal_search),
+        'category': fold_pattern(query.category_search),
+        'area': fold_pattern(query.area_search),
+        'tags': tuple(sorted({fold_pattern(tag) for tag in query.tags_search.split()})),
+        'ingredients': tuple(sorted({fold_pattern(term) for term in parse_ingredient_terms(query.ingredients_search)})),
+        'min_stars': min_stars,
+        'vegetarian': query.vegetarian_filter,
+        'kosher': query.kosher_filter,
+        'num_ingredients': query.num_ingredients,
+        'pantry': tuple(sorted(parse_pantry_items(query.pantry_search))),
+        'ranges': parse_ranges(query.ranges),
+        'diets': parse_diets(query.diets),
+    }
+    if fields['pantry']:
+        fields['max_missing'] = query.max_missing
+    # Pantry Coverage ranks by name when there is no pantry
+    if query.sort_by != 'Name' and (query.sort_by != 'Pantry Coverage' or fields['pantry']):
+        fields['sort_by'] = query.sort_by
+    return tuple((name, value) for name, value in fields.items() if value or name == 'max_missing')
+
+
+def frame_nbytes(df):
+    """Memory a DataFrame slice of the corpus holds on its own.
+
+    Categorical columns share their categories with the corpus, so only the codes count.
+    """
+    nbytes = df.index.nbytes
+    for name, column in df.items():
+        nbytes += column.cat.codes.nbytes if isinstance(column.dtype, pd.CategoricalDtype) else column.nbytes
+    return int(nbytes)
+
+
+class ResultCache:
+    """Bounded, thread-safe LRU of search results shared by every session of the process.
+
+    Entries are evicted least recently used first once there are more than max_entries
+    or their sizes add up to more than max_bytes, and expire ttl seconds after they were
+    stored. Every entry belongs to one Corpus: the first lookup against a different one
+    (a rebuild or merged delta segments) drops them all. An entry stored with a ratings
+    version is only served while the ratings are at that version; results that do not
+    depend on ratings are stored without one.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._corpus = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _check_corpus(self, corpus):
+        if self._corpus is not corpus:
+            self.counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._corpus = corpus
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[3]
+
+    def get(self, key, corpus, ratings_version=None):
+        """The value stored for key, or None."""
+        with self._lock:
+            self._check_corpus(corpus)
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= self.clock():
+                self._remove(key)
+                self.counters['expirations'] += 1
+                entry = None
+            elif entry is not None and entry[1] != ratings_version:
+                self._remove(key)
+                self.counters['invalidations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, key, corpus, value, nbytes, ratings_version=None):
+        with self._lock:
+            # A search that started before the corpus was replaced has nothing worth keeping
+            if corpus is not self._corpus:
+                return
+            if key in self._entries:
+                self._remove(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, ratings_version, self.clock() + self.ttl, nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters since the process started, plus the current size."""
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return dict(self.counters, entries=len(self._entries), bytes=self._bytes,
+                        hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
@@ -0,0 +1,371 @@
+import numpy as np
+import math
+import os
+import threading
+from dataclasses import dataclass, fields
+from corpus import get_corpus
+from facets import pack
+from query import plan_search, category_column
+from pantry import parse_pantry_items, DEFAULT_MAX_MISSING
+from numeric_index import NUMERIC_COLUMNS, parse_ranges, parse_diets
+from export import write_export, EXPORT_BATCH_SIZE
+from result_cache import ResultCache, frame_nbytes, query_key
+from ratings_store import get_ratings_store
+from substitutions import load_substitutions, compile_substitutions
+from profiling import stage
+
+SORT_OPTIONS = ['Name', 'Top Rated', 'Pantry Coverage']
+
+STAR_RATINGS = {
+    '★★★★★': 5,
+    '★★★★☆': 4,
+    '★★★☆☆': 3,
+    '★★☆☆☆': 2,
+    '★☆☆☆☆': 1,
+    '☆☆☆☆☆': 0
+}
+
+
+# How SearchQuery.from_dict names the field types in its errors
+JSON_TYPE_NAMES = {str: 'a string', bool: 'true or false'}
+
+
+def star_rating_to_numeric(star_rating):
+    """Minimum stars from a search_bar star string (or a number from 0 to 5 from API clients).
+
+    Anything else is a ValueError rather than no minimum.
+    """
+    if isinstance(star_rating, str) and star_rating in STAR_RATINGS:
+        return STAR_RATINGS[star_rating]
+    try:
+        # GET parameters are strings, e.g. '4' or '3.5'
+        stars = None if isinstance(star_rating, bool) else float(star_rating)
+    except (TypeError, ValueError):
+        stars = None
+    if stars is None or not 0 <= stars <= 5:
+        raise ValueError(f'min_star_rating must be a star string or a number from 0 to 5, not {star_rating!r}')
+    return stars
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """The search_bar inputs, plus sorting; substitutions are rule labels.
+
+    pantry_search lists what is at hand (comma separated); recipes needing more than
+    max_missing other ingredients are left out. ranges are (column, low, high) filters on
+    the numeric fields, e.g. (('ready_in_minutes', None, 30),), and diets names the diet
+    flags every result must have (see numeric_index.py).
+    """
+    meal_search: str = ''
+    category_search: str = ''
+    area_search: str = ''
+    tags_search: str = ''
+    ingredients_search: str = ''
+    min_star_rating: str = ''
+    vegetarian_filter: bool = False
+    kosher_filter: bool = False
+    num_ingredients: str = ''
+    substitutions: tuple = ()
+    sort_by: str = 'Name'
+    pantry_search: str = ''
+    max_missing: int = DEFAULT_MAX_MISSING
+    ranges: tuple = ()
+    diets: tuple = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a query from JSON-like data, ignoring unknown keys.
+
+        Every value must have the type of its field's default (min_star_rating may also be
+        a number, max_missing a string of digits), min_star_rating be one star_rating_to_numeric
+        accepts and sort_by one of SORT_OPTIONS; ValueError otherwise.
+        """
+        defaults = {field.name: field.default for field in fields(cls)}
+        values = {key: value for key, value in data.items() if key in defaults}
+        for key, value in values.items():
+            expected = type(defaults[key])
+            if key == 'substitutions':
+                if not isinstance(value, (list, tuple)) or not all(isinstance(label, str) for label in value):
+                    raise ValueError('substitutions must be a list of rule labels')
+            elif key == 'max_missing':
+                if isinstance(value, bool) or not isinstance(value, (int, str)):
+                    raise ValueError('max_missing must be an integer')
+            elif key == 'min_star_rating' and isinstance(value, (int, float)) and not isinstance(value, bool):
+                continue
+            elif key not in ('ranges', 'diets') and not isinstance(value, expected):
+                raise ValueError(f'{key} must be {JSON_TYPE_NAMES[expected]}, not {type(value).__name__}')
+        if values.get('min_star_rating'):
+            star_rating_to_numeric(values['min_star_rating'])
+        if values.get('sort_by', 'Name') not in SORT_OPTIONS:
+            raise ValueError(f'sort_by must be one of {SORT_OPTIONS}')
+        if 'substitutions' in values:
+            values['substitutions'] = tuple(values['substitutions'])
+        if 'max_missing' in values:
+            values['max_missing'] = int(values['max_missing'])
+        # Ranges come as {column: [low, high]}
+        if 'ranges' in values:
+            values['ranges'] = parse_ranges(values['ranges'])
+        if 'diets' in values:
+            values['diets'] = parse_diets(values['diets'])
+        return cls(**values)
+
+    def has_criteria(self):
+        """Whether any filter is set; without one the app shows no results."""
+        return bool(self.meal_search or self.category_search or self.area_search or self.tags_search or
+                    self.ingredients_search or self.min_star_rating or self.vegetarian_filter or
+                    self.kosher_filter or self.num_ingredients or self.pantry_search or
+                    parse_ranges(self.ranges) or self.diets)
+
+
+class SearchResult:
+    """Matching rows of one search in display order; details and similar items are read per page.
+
+    `cached` says whether the row order came from the result cache, in which case `plan`
+    is the plan of the search that filled it.
+    """
+
+    def __init__(self, corpus, query, df, plan, substitute, pantry=None, cached=False):
+        self.corpus = corpus
+        self.query = query
+        self.df = df
+        self.plan = plan
+        self.substitute = substitute
+        self.pantry = pantry
+        self.cached = cached
+
+    @property
+    def total(self):
+        return len(self.df)
+
+    def with_details(self, df):
+        """Rows of self.df as shown: with details, substitutions and (for a pantry) missing ingredients."""
+        df = self.corpus.with_details(df)
+        df['ingredients'] = df['ingredients'].map(self.substitute, na_action='ignore')
+        if self.pantry is not None:
+            positions = self.corpus.combined_df.index.get_indexer(df.index)
+            df['missing_ingredients'] = self.pantry.missing_ingredients(positions)
+        return df
+
+    def page(self, start, stop):
+        """(page_df, similar_items) for rows start:stop, with details and substitutions applied."""
+        with stage('page.details') as record:
+            page_df = self.with_details(self.df.iloc[start:stop])
+            record['rows'] = len(page_df)
+        return page_df, self.corpus.similar_items(page_df.index)
+
+    def export(self, sink, export_format, batch_size=EXPORT_BATCH_SIZE):
+        """Stream every match to sink as CSV, Parquet or JSON Lines; see export.write_export."""
+        return write_export(self, sink, export_format, batch_size)
+
+    def to_dict(self, start, stop):
+        """A JSON-ready page of results."""
+        page_df, similar_items = self.page(start, stop)
+        rows = []
+        for (row_id, row), similar in zip(page_df.iterrows(), similar_items):
+            entry = {
+                'id': int(row_id),
+                'recipe_id': json_value(row['recipe_id']),
+                'strMeal': json_value(row['strMeal']),
+                'strMealThumb': json_value(row['strMealThumb']),
+                'source': json_value(row['source']),
+                'strCategory': json_value(row['strCategory']),
+                'strArea': json_value(row['strArea']),
+                'avg_rating': float(row['avg_rating']),
+                'rating_count': int(row['rating_count']),
+                **{column: json_value(float(row[column])) for column in NUMERIC_COLUMNS},
+                'ingredients': json_value(row['ingredients']),
+                'strInstructions': json_value(row['strInstructions']),
+                'video_url': json_value(row['video_url']),
+                'similar': [{'id': int(similar_id), 'strMeal': json_value(item['strMeal']),
+                             'strMealThumb': json_value(item['strMealThumb'])}
+                            for similar_id, item in similar.iterrows()],
+            }
+            if self.pantry is not None:
+                entry['pantry_coverage'] = float(row['pantry_coverage'])
+                entry['missing_ingredients'] = row['missing_ingredients']
+            rows.append(entry)
+        return {'total': self.total, 'start': start, 'stop': min(stop, self.total), 'notes': self.plan.notes,
+                'cached': self.cached, 'results': rows}
+
+
+def json_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+
+class SearchEngine:
+    """The app's load, filter, rank and similar-items pipeline, without any Streamlit calls.
+
+    Safe to share between threads: every search reads the current process-wide Corpus and
+    only derives new frames from it. The ordered rows of recent searches are kept in
+    `result_cache` (see ResultCache), shared by every session using this engine.
+    """
+
+    def __init__(self, base_dir, result_cache=None):
+        self.base_dir = base_dir
+        self.ratings_store = get_ratings_store(base_dir)
+        self.result_cache = result_cache or ResultCache()
+        self._ratings_cache = (None, None, None)
+
+    @property
+    def corpus(self):
+        return get_corpus(self.base_dir)
+
+    @property
+    def categories(self):
+        return self.corpus.categories
+
+    def substitutions(self):
+        """Substitution rules clients can name in `SearchQuery.substitutions` (re-read each call)."""
+        return load_substitutions(self.base_dir)
+
+    def pantry_coverage(self, corpus, query):
+        """PantryCoverage of query's pantry over the corpus, or None without one."""
+        items = parse_pantry_items(query.pantry_search)
+        if not items:
+            return None
+        with stage('search.pantry', rows=len(corpus.combined_df)):
+            return corpus.pantry_index.coverage(items)
+
+    def plan(self, corpus, query, pantry=None):
+        if pantry is None:
+            pantry = self.pantry_coverage(corpus, query)
+        with stage('search.plan', rows=len(corpus.combined_df)):
+            return plan_search(corpus.combined_df, corpus.ingredient_index, query.meal_search, query.category_search,
+                               query.area_search, query.tags_search, query.ingredients_search,
+                               query.vegetarian_filter, query.kosher_filter, query.num_ingredients,
+                               title_index=corpus.title_index, live=corpus.live, pantry=pantry,
+                               max_missing=query.max_missing, numeric_indexes=corpus.numeric_indexes,
+                               ranges=parse_ranges(query.ranges), diets=parse_diets(query.diets))
+
+    def result_rows(self, corpus, positions, pantry=None):
+        """combined_df rows at positions, with the pantry coverage (if any) and rating columns."""
+        df = corpus.combined_df.iloc[positions]
+        if pantry is not None:
+            df = df.assign(pantry_coverage=pantry.fraction()[positions], pantry_missing=pantry.missing()[positions])
+        # Join the aggregated ratings onto the rows in one vectorized merge
+        return self.ratings_store.join_ratings(df)
+
+    def cache_result(self, key, corpus, positions, plan, pantry, df, version, ratings_version):
+        # df was joined at ratings `version`; the entry itself only depends on ratings_version
+        nbytes = positions.nbytes + frame_nbytes(df) + (pantry.nbytes if pantry is not None else 0)
+        self.result_cache.put(key, corpus, (positions, plan, pantry, df, version), nbytes, ratings_version)
+
+    def search(self, query):
+        """Run a SearchQuery; the caller decides whether a query without criteria is worth running."""
+        corpus = self.corpus
+        min_stars = star_rating_to_numeric(query.min_star_rating) if query.min_star_rating else 0
+        key = query_key(query, min_stars)
+        version = self.ratings_store.version()
+        # Only the rating filter and the Top Rated order make the row order depend on the ratings
+        ratings_version = version if min_stars or query.sort_by == 'Top Rated' else None
+        cached = self.result_cache.get(key, corpus, ratings_version)
+        if cached is not None:
+            positions, plan, pantry, df, joined_version = cached
+            # Other entries outlive a rating; their rows just need the current rating columns
+            if joined_version != version:
+                with stage('search.cached', rows=len(positions)):
+                    df = self.result_rows(corpus, positions, pantry)
+                self.cache_result(key, corpus, positions, plan, pantry, df, version, ratings_version)
+        else:
+            pantry = self.pantry_coverage(corpus, query)
+            plan = self.plan(corpus, query, pantry)
+            with stage('search.filter') as record:
+                positions = plan.execute()
+                record['rows'] = len(positions)
+
+            with stage('search.ratings') as record:
+                df = self.result_rows(corpus, positions, pantry)
+                if min_stars:
+                    df = df[df['avg_rating'] >= min_stars]
+                record['rows'] = len(df)
+
+            # Sort alphabetically by 'strMeal', by Bayesian-average rating, or by the share of
+            # ingredients the pantry covers (then fewest missing)
+            with stage('search.sort', rows=len(df)):
+                if query.sort_by == 'Top Rated':
+                    df = df.sort_values(by=['bayesian_rating', 'strMeal'], ascending=[False, True])
+                elif query.sort_by == 'Pantry Coverage' and pantry is not None:
+                    df = df.sort_values(by=['pantry_coverage', 'pantry_missing', 'strMeal'],
+                                        ascending=[False, True, True])
+                else:
+                    df = df.sort_values(by='strMeal', ascending=True)
+
+            positions = corpus.combined_df.index.get_indexer(df.index)
+            self.cache_result(key, corpus, positions, plan, pantry, df, version, ratings_version)
+
+        rules = [rule for rule in self.substitutions() if rule['label'] in query.substitutions]
+        return SearchResult(corpus, query, df, plan, compile_substitutions(rules), pantry, cached=cached is not None)
+
+    def average_ratings(self, corpus):
+        """avg_rating of every corpus row, recomputed only when the ratings or the corpus change."""
+        version = self.ratings_store.version()
+        cached_version, cached_corpus, ratings = self._ratings_cache
+        if cached_version != version or cached_corpus is not corpus:
+            ratings = self.ratings_store.join_ratings(corpus.combined_df[['strMeal']])['avg_rating'].to_numpy()
+            self._ratings_cache = (version, corpus, ratings)
+        return ratings
+
+    def facet_counts(self, query):
+        """Result counts for every category, region and dietary option of search_bar.
+
+        Each option is counted under all of query's other filters, i.e. the results that
+        choosing it (instead of the current choice for that input) would give. Every
+        filter is packed into a row bitmap once; see FacetIndex.counts.
+        """
+        corpus = self.corpus
+        index = corpus.facet_index
+        all_positions = np.arange(len(corpus.combined_df))
+        with stage('facets.masks') as record:
+            bitmaps = {}
+            for predicate in self.plan(corpus, query).predicates:
+                # Filters without counts of their own (tags, ingredients, ...) are grouped together
+                facet = predicate.facet or 'other'
+                bitmap = pack(predicate.evaluate(all_positions))
+                bitmaps[facet] = bitmap & bitmaps[facet] if facet in bitmaps else bitmap
+            if query.min_star_rating:
+                bitmaps['rating'] = pack(self.average_ratings(corpus) >= star_rating_to_numeric(query.min_star_rating))
+            record['rows'] = len(all_positions)
+
+        def rows_without(facet):
+            base = index.all_rows()
+            for name, bitmap in bitmaps.items():
+                if name != facet:
+                    base = base & bitmap
+            return base
+
+        with stage('facets.counts', rows=len(all_positions)):
+            meal_mask = None
+            if 'meal' in bitmaps:
+                meal_mask = np.unpackbits(bitmaps['meal'], count=len(all_positions)).astype(bool)
+            categories = index.counts(index.category_bitmaps[category_column(corpus.combined_df, meal_mask)],
+                                      rows_without('category'))
+            areas = index.counts(index.area_bitmaps, rows_without('area'))
+            vegetarian = index.counts(index.dietary_bitmaps[:1], rows_without('vegetarian'))[0]
+            kosher = index.counts(index.dietary_bitmaps[1:], rows_without('kosher'))[0]
+            total = int(np.bitwise_count(rows_without(None)).sum())
+        return {
+            'total': total,
+            'category': dict(zip(index.categories, categories.tolist())),
+            'area': dict(zip(index.areas, areas.tolist())),
+            'vegetarian': int(vegetarian),
+            'kosher': int(kosher),
+        }
+
+    def rate(self, meal, stars):
+        """Record a 1-5 star rating for a meal title."""
+        self.ratings_store.add_rating(meal, stars)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_search_engine(base_dir):
+    """Process-wide SearchEngine for base_dir."""
+    base_dir = os.path.abspath(base_dir)
+    with _engines_lock:
+        if base_dir not in _engines:
+            _engines[base_dir] = SearchEngine(base_dir)
+        return _engines[base_dir]
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from deltas import Compactor
+from numeric_index import NUMERIC_COLUMNS
+from search_engine import SearchQuery, get_search_engine
+
+# Searches running at once; more would only contend for the GIL
+DEFAULT_CONCURRENCY = 4
+# Requests allowed to wait for a slot before new ones are turned away with 503
+DEFAULT_MAX_PENDING = 64
+MAX_BODY_BYTES = 64 * 1024
+MAX_PAGE_SIZE = 100
+
+BOOLEAN_FIELDS = {'vegetarian_filter', 'kosher_filter', 'explain'}
+LIST_FIELDS = {'substitutions', 'diets'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_range_param(column, value):
+    """A `low:high` query-string range as [low, high], an empty end left open."""
+    low, sep, high = value.partition(':')
+    try:
+        if not sep:
+            raise ValueError
+        return [float(end) if end.strip() else None for end in (low, high)]
+    except ValueError:
+        raise HTTPError(400, f'{column} must be low:high, either end empty, not {value!r}')
+
+
+def params_to_dict(params):
+    """Query-string parameters as the JSON body a POST would carry.
+
+    List fields are repeated (diets=is_vegan&diets=is_gluten_free) and a numeric column
+    is a range written low:high with either end empty (ready_in_minutes=:30).
+    """
+    data = {}
+    for key, values in params.items():
+        if key in LIST_FIELDS:
+            data[key] = values
+        elif key in NUMERIC_COLUMNS:
+            data.setdefault('ranges', {})[key] = parse_range_param(key, values[-1])
+        elif key in BOOLEAN_FIELDS:
+            data[key] = values[-1].lower() in ('1', 'true', 'yes', 'on')
+        else:
+            data[key] = values[-1]
+    return data
+
+
+def page_range(data):
+    try:
+        page = max(int(data.get('page', 1)), 1)
+        page_size = min(max(int(data.get('page_size', 25)), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise HTTPError(400, 'page and page_size must be integers')
+    start = (page - 1) * page_size
+    return start, start + page_size
+
+
+class SearchServer:
+    """JSON over HTTP/1.1 (keep-alive) in front of a SearchEngine.
+
+    GET or POST /search runs a query (fields of SearchQuery plus `page`, `page_size` and
+    `explain`; see params_to_dict for the GET form of lists and ranges), /facets returns
+    the option counts for a query, POST /rate records {"meal", "stars"}, GET /health
+    reports the corpus size and GET /stats the result cache counters. Engine calls run on
+    `max_concurrency` worker threads; once `max_pending` more requests are queued behind
+    them, new ones get 503 instead of waiting without bound.
+    """
+
+    def __init__(self, engine, max_concurrency=DEFAULT_CONCURRENCY, max_pending=DEFAULT_MAX_PENDING):
+        self.engine = engine
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_concurrency)
+        self.in_flight = 0
+
+    async def call_engine(self, func, *args):
+        if self.in_flight >= self.max_concurrency + self.max_pending:
+            raise HTTPError(503, 'too many requests in flight')
+        self.in_flight += 1
+        try:
+            # The executor's thread count is the concurrency limit; the rest queue in it
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def search(self, data):
+        start, stop = page_range(data)
+        try:
+            query = SearchQuery.from_dict(data)
+        except (TypeError, ValueError) as error:
+            raise HTTPError(400, str(error))
+        if not query.has_criteria():
+            return {'total': 0, 'start': 0, 'stop': 0, 'notes': {}, 'results': []}
+        result = self.engine.search(query)
+        payload = result.to_dict(start, stop)
+        if data.get('explain'):
+            payload['explain'] = result.plan.explain().to_dict('records')
+        return payload
+
+    def facets(self, data):
+        try:
+            query = SearchQuery.from_dict(data)
+        except (TypeError, ValueError) as error:
+            raise HTTPError(400, str(error))
+        return self.engine.facet_counts(query)
+
+    def rate(self, data):
+        try:
+            meal, stars = data['meal'], int(data['stars'])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPError(400, 'rate needs "meal" and integer "stars"')
+        if not 1 <= stars <= 5:
+            raise HTTPError(400, 'stars must be between 1 and 5')
+        self.engine.rate(meal, stars)
+        return {'status': 'ok'}
+
+    def health(self, data):
+        return {'status': 'ok', 'rows': len(self.engine.corpus.combined_df)}
+
+    def stats(self, data):
+        return {'result_cache': self.engine.result_cache.stats()}
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        routes = {'/search': ({'GET', 'POST'}, self.search), '/facets': ({'GET', 'POST'}, self.facets),
+                  '/rate': ({'POST'}, self.rate), '/health': ({'GET'}, self.health), '/stats': ({'GET'}, self.stats)}
+        if url.path not in routes:
+            raise HTTPError(404, f'no route for {url.path}')
+        methods, handler = routes[url.path]
+        if method not in methods:
+            raise HTTPError(405, f'{method} not allowed on {url.path}')
+        if method == 'POST':
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                raise HTTPError(400, 'body is not valid JSON')
+            if not isinstance(data, dict):
+                raise HTTPError(400, 'body must be a JSON object')
+        else:
+            data = params_to_dict(parse_qs(url.query))
+        return await self.call_engine(handler, data)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                try:
+                    method, target, _ = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise HTTPError(413, 'request body too large')
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except HTTPError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except ValueError:
+                    status, payload, keep_alive = 400, {'error': 'malformed request'}, False
+                except Exception:
+                    # A bug must still get a response rather than a dropped connection
+                    logger.exception('error handling %r', request_line)
+                    status, payload, keep_alive = 500, {'error': 'internal server error'}, False
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+                f'Content-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """Start listening and return the asyncio.Server (port 0 picks a free port)."""
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+
+async def serve(base_dir, host, port, max_concurrency, max_pending, compact_interval=None):
+    engine = get_search_engine(base_dir)
+    # Load the corpus before accepting requests, so the first ones are not stuck behind it
+    engine.corpus
+    # Appended recipes (python deltas.py append) show up on the next request either way;
+    # the compactor only keeps the number of delta segments down
+    if compact_interval:
+        Compactor(base_dir, compact_interval).start()
+    server = await SearchServer(engine, max_concurrency, max_pending).start(host, port)
+    print(f'Serving search on http://{host}:{server.sockets[0].getsockname()[1]}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve recipe search as JSON over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING)
+    parser.add_argument('--compact-interval', type=float,
+                        help='fold appended delta segments into the base every this many seconds')
+    args = parser.parse_args()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    asyncio.run(serve(base_dir, args.host, args.port, args.concurrency, args.max_pending, args.compact_interval))
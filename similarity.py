@@ -1,4 +1,9 @@
+import numpy as np
+import copy
 import pandas as pd
+from scipy.sparse import csr_matrix, vstack
+from compact import InternedLists
+from profiling import stage
 
 def jaccard_similarity(set1, set2):
     intersection = len(set1.intersection(set2))
@@ -33,4 +38,181 @@ def find_top_similar_items(search_ingredients, search_meal, df):
     ]
 
     top_items = df_filtered.nlargest(3, 'similarity')
-    return top_items[['strMeal', 'strMealThumb', 'isolated_ingredients']]
\ No newline at end of file
+    return top_items[['strMeal', 'strMealThumb', 'isolated_ingredients']]
+
+def extend_factorize(vocabulary, values):
+    """pd.factorize of values, continuing `vocabulary` (a unique pd.Index): known values keep their codes."""
+    codes = vocabulary.get_indexer(values)
+    unseen = codes < 0
+    added_codes, added_values = pd.factorize(values[unseen])
+    codes[unseen] = added_codes + len(vocabulary)
+    return codes, vocabulary.append(pd.Index(added_values))
+
+
+def binary_matrix(rows, codes, row_count, column_count):
+    matrix = csr_matrix((np.ones(len(codes), dtype=np.int32), (rows, codes)), shape=(row_count, column_count))
+    # Repeated tokens within a row count once, as in a set
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix
+
+
+def encode_token_sets(token_lists, row_count, vocabulary=None):
+    """Encode per-row token lists as a binary CSR matrix over a shared vocabulary.
+
+    Tokens already in `vocabulary` (a pd.Index from an earlier call) keep their columns.
+    """
+    tokens = token_lists.explode()
+    tokens = tokens[tokens.notna() & (tokens != '')]
+    codes, vocabulary = extend_factorize(pd.Index([], dtype=object) if vocabulary is None else vocabulary,
+                                         pd.Index(tokens.to_numpy(), dtype=object))
+    return binary_matrix(tokens.index.to_numpy(), codes, row_count, len(vocabulary)), vocabulary
+
+
+def with_columns(matrix, column_count):
+    return csr_matrix((matrix.data, matrix.indices, matrix.indptr), shape=(matrix.shape[0], column_count))
+
+
+def append_rows(matrix, added):
+    """matrix with the rows of `added` below it, widened to the wider of the two."""
+    column_count = max(matrix.shape[1], added.shape[1])
+    return vstack([with_columns(matrix, column_count), with_columns(added, column_count)], format='csr')
+
+
+def batch_jaccard(matrix, sizes, query_positions):
+    """Jaccard similarity of each query row against every row, as a dense (queries x rows) array."""
+    intersection = (matrix[query_positions] @ matrix.T).toarray().astype(np.float64)
+    union = sizes[query_positions][:, None] + sizes[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+
+def top_k(scores, k):
+    """Positions and scores of the k best finite scores, ties going to the earlier position."""
+    if len(scores) > k:
+        # Keep every row tied with the k-th best score, then order them stably
+        kth_score = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= kth_score)
+    else:
+        candidates = np.arange(len(scores))
+    top = candidates[np.argsort(-scores[candidates], kind='stable')][:k]
+    top = top[np.isfinite(scores[top])]
+    return top, scores[top]
+
+
+class SimilarityEngine:
+    """Vectorized version of `find_top_similar_items` over a fixed DataFrame.
+
+    Ingredient and title token sets are encoded once into sparse binary matrices, so the
+    top-k for a whole batch of query rows comes from a few sparse products instead of one
+    Python pass over the corpus per query. Scores, exact-match exclusion and tie order
+    (first row wins, as with `nlargest`) match `find_top_similar_items`. Rows outside the
+    `live` mask (superseded by a newer version of the recipe) are never returned.
+    """
+
+    # Upper bound on the size of the dense score block computed at once
+    max_block_cells = 1 << 24
+
+    def __init__(self, df, ingredient_lists=None, live=None):
+        """`ingredient_lists` (InternedLists) stands in for df's isolated_ingredients column when given."""
+        if ingredient_lists is None:
+            ingredient_lists = InternedLists.from_joined(df['isolated_ingredients'])
+        self.df = df[['strMeal', 'strMealThumb']].iloc[:0].reset_index(drop=True)
+        self.labels = df.index[:0]
+        self.ingredient_matrix = csr_matrix((0, 0), dtype=np.int32)
+        self.meal_matrix = csr_matrix((0, 0), dtype=np.int32)
+        # Lower-cased ingredient of every interned id, title words and (ingredients, title) keys seen so far
+        self.lower_codes = np.zeros(0, dtype=np.int64)
+        self.lower_vocabulary = pd.Index([], dtype=object)
+        self.meal_vocabulary = pd.Index([], dtype=object)
+        self.match_vocabulary = pd.Index([], dtype=object)
+        self.match_keys = np.zeros(0, dtype=np.int64)
+        self._append(df, ingredient_lists)
+        self.set_live(live)
+
+    def _append(self, df, ingredient_lists):
+        """Encode the rows of df, which are the rows of ingredient_lists past the ones already encoded."""
+        start = len(self.df)
+        self.df = pd.concat([self.df, df[['strMeal', 'strMealThumb']]], ignore_index=True)
+        self.labels = self.labels.append(df.index)
+        self.ingredient_lists = ingredient_lists
+        meals = df['strMeal'].fillna('').str.lower().reset_index(drop=True)
+
+        # Ingredient ids are interned case-sensitively; similarity compares them lower-cased
+        added_vocabulary = pd.Series(ingredient_lists.vocabulary[len(self.lower_codes):].to_pylist(), dtype=object)
+        added_codes, self.lower_vocabulary = extend_factorize(self.lower_vocabulary,
+                                                              pd.Index(added_vocabulary.str.lower(), dtype=object))
+        self.lower_codes = np.concatenate([self.lower_codes, added_codes])
+        first_item = ingredient_lists.offsets[start]
+        lower_ids = self.lower_codes[ingredient_lists.ids[first_item:]]
+        present = ~np.asarray(self.lower_vocabulary == '')[lower_ids]
+        rows = ingredient_lists.rows()[first_item:] - start
+        self.ingredient_matrix = append_rows(self.ingredient_matrix, binary_matrix(
+            rows[present], lower_ids[present], len(df), len(self.lower_vocabulary)))
+        meal_matrix, self.meal_vocabulary = encode_token_sets(meals.str.split(), len(df), self.meal_vocabulary)
+        self.meal_matrix = append_rows(self.meal_matrix, meal_matrix)
+        self.ingredient_sizes = np.asarray(self.ingredient_matrix.sum(axis=1)).ravel().astype(np.float64)
+        self.meal_sizes = np.asarray(self.meal_matrix.sum(axis=1)).ravel().astype(np.float64)
+
+        # Rows with the same lower-cased ingredients and title count as exact matches of each other
+        ingredient_keys = pd.Series(ingredient_lists.joined(np.arange(start, len(self.df))), dtype=object).str.lower()
+        match_keys, self.match_vocabulary = extend_factorize(self.match_vocabulary,
+                                                             pd.Index(ingredient_keys + '\0' + meals.astype(object), dtype=object))
+        self.match_keys = np.concatenate([self.match_keys, match_keys])
+
+    def set_live(self, live):
+        self.dead = None if live is None else np.flatnonzero(~np.asarray(live, dtype=bool))
+
+    def extend(self, df, ingredient_lists, live=None):
+        """A new engine over this engine's rows followed by the rows of df.
+
+        `ingredient_lists` covers all of them (see InternedLists.extend); only df's rows are
+        encoded, the existing matrices are reused.
+        """
+        engine = copy.copy(self)
+        engine._append(df, ingredient_lists)
+        engine.set_live(live)
+        return engine
+
+    def scores(self, query_positions):
+        ingredients_similarity = batch_jaccard(self.ingredient_matrix, self.ingredient_sizes, query_positions)
+        meal_similarity = batch_jaccard(self.meal_matrix, self.meal_sizes, query_positions)
+        scores = (2 * ingredients_similarity + meal_similarity) / 3
+        scores[self.match_keys[query_positions][:, None] == self.match_keys[None, :]] = -np.inf
+        if self.dead is not None:
+            scores[:, self.dead] = -np.inf
+        return scores
+
+    def pair_scores(self, left, right):
+        """Scores of the row pairs (left[i], right[i]), equal to the matching entries of `scores`."""
+        def jaccard(matrix, sizes):
+            intersection = np.asarray(matrix[left].multiply(matrix[right]).sum(axis=1), dtype=np.float64).ravel()
+            union = sizes[left] + sizes[right] - intersection
+            return np.divide(intersection, union, out=np.zeros_like(intersection), where=union != 0)
+
+        scores = (2 * jaccard(self.ingredient_matrix, self.ingredient_sizes) + jaccard(self.meal_matrix, self.meal_sizes)) / 3
+        scores[self.match_keys[left] == self.match_keys[right]] = -np.inf
+        if self.dead is not None:
+            scores[np.isin(right, self.dead)] = -np.inf
+        return scores
+
+    def top_k_positions(self, query_positions, k=3):
+        """Positions and scores of the k most similar rows for each query position."""
+        query_positions = np.asarray(query_positions, dtype=np.int64)
+        block_size = max(1, self.max_block_cells // max(len(self.df), 1))
+        results = []
+        for start in range(0, len(query_positions), block_size):
+            block_scores = self.scores(query_positions[start:start + block_size])
+            results.extend(top_k(scores, k) for scores in block_scores)
+        return results
+
+    def top_similar(self, labels, k=3):
+        """For each row label, a DataFrame of its top k similar items like `find_top_similar_items`."""
+        query_positions = self.labels.get_indexer(labels)
+        top_items = []
+        with stage('similar_items.compute', rows=len(labels)):
+            for positions, scores in self.top_k_positions(query_positions, k):
+                items = self.df.iloc[positions].assign(isolated_ingredients=self.ingredient_lists.joined(positions),
+                                                       similarity=scores)
+                items.index = self.labels[positions]
+                top_items.append(items[['strMeal', 'strMealThumb', 'isolated_ingredients']])
+        return top_items
@@ -1,8 +1,27 @@
 import pandas as pd
 import os
 import json
+import html
+from html.entities import html5 as html5_entities
+import re
 from bs4 import BeautifulSoup
-from utils import extract_ingredients
+from utils import extract_ingredients, map_rows as serial_map_rows
+from profiling import stage
+
+LIST_ITEM = re.compile(r'<li\b[^>]*>(.*?)</li\s*>', re.IGNORECASE | re.DOTALL)
+LIST_ITEM_TAG = re.compile(r'</?li\b', re.IGNORECASE)
+TAG = re.compile(r'</?[a-zA-Z][^<>]*>')
+UNSAFE_MARKUP = re.compile(r'<!|<\?|<script|<style|<textarea|<title', re.IGNORECASE)
+ENTITY = re.compile(r'&(#?[a-zA-Z0-9]*)(;?)')
+NUMERIC_ENTITY = re.compile(r'#(?:[0-9]+|[xX][0-9a-fA-F]+)')
+
+# Columns the corpus build reads from spoonacular.parquet: display and search fields,
+# plus the numeric fields and diet flags kept for filtering
+SPOONACULAR_COLUMNS = [
+    'id', 'title', 'instructions', 'image', 'sourceUrl', 'author', 'ingredients', 'parsed_ingredients', 'parsed_dish_types',
+    'readyInMinutes', 'servings', 'pricePerServing', 'healthScore', 'aggregateLikes',
+    'vegetarian', 'vegan', 'glutenFree', 'dairyFree'
+]
 
 def parse_ingredients(ingredients_str):
     if not isinstance(ingredients_str, str):
@@ -14,9 +33,52 @@ def parse_ingredients(ingredients_str):
     except (ValueError, SyntaxError):
         return ""
 
+def extract_list_items(instructions_str):
+    """Fast path for `parse_instructions`: the text of each <li>, or None if the markup needs a real parser.
+
+    Matches BeautifulSoup's get_text(strip=True) for well-formed, non-nested list items:
+    every text fragment between tags is unescaped, stripped and concatenated.
+    """
+    if UNSAFE_MARKUP.search(instructions_str) or not plain_entities(instructions_str):
+        return None
+    bodies = LIST_ITEM.findall(instructions_str)
+    # Unclosed, stray or nested <li> tags
+    if len(LIST_ITEM_TAG.findall(instructions_str)) != 2 * len(bodies):
+        return None
+    items = []
+    for body in bodies:
+        fragments = TAG.split(body)
+        if any('<' in fragment or '>' in fragment for fragment in fragments):
+            return None
+        items.append(''.join(html.unescape(fragment).strip() for fragment in fragments))
+    return items
+
+
+def plain_entities(text):
+    """Whether html.unescape decodes every entity reference in text the way BeautifulSoup does.
+
+    That holds for numeric references and known named ones with a closing ';'.
+    """
+    for match in ENTITY.finditer(text):
+        name, semicolon = match.groups()
+        if not name:
+            continue
+        if not semicolon or not (NUMERIC_ENTITY.fullmatch(name) or name + ';' in html5_entities):
+            return False
+    return True
+
+
 def parse_instructions(instructions_str):
     if instructions_str is None:
         return ""
+    if isinstance(instructions_str, str):
+        steps = extract_list_items(instructions_str)
+        if steps is not None:
+            return '\n'.join(f"{i + 1}. {step}" for i, step in enumerate(steps))
+    return parse_instructions_html(instructions_str)
+
+
+def parse_instructions_html(instructions_str):
     try:
         soup = BeautifulSoup(instructions_str, 'html.parser')
         steps = soup.find_all('li')
@@ -25,22 +87,40 @@ def parse_instructions(instructions_str):
     except Exception:
         return ""
 
-def load_spoonacular_data(base_dir):
+def load_spoonacular_data(base_dir, map_rows=serial_map_rows, columns=SPOONACULAR_COLUMNS):
+    """Read spoonacular.parquet (only the given columns; None reads all) and parse it row by row."""
     spoonacular_parquet_file_path = os.path.join(base_dir, 'spoonacular.parquet')
-    spoonacular_df = pd.read_parquet(spoonacular_parquet_file_path)
+    with stage('spoonacular.read') as record:
+        spoonacular_df = pd.read_parquet(spoonacular_parquet_file_path, columns=columns)
+        record['rows'] = len(spoonacular_df)
+    return parse_spoonacular_frame(spoonacular_df, map_rows)
+
 
+def parse_spoonacular_frame(spoonacular_df, map_rows=serial_map_rows):
+    """Rename and parse Spoonacular rows (with the columns of spoonacular.parquet)."""
     spoonacular_df = spoonacular_df.rename(columns={
         'title': 'strMeal',
         'instructions': 'strInstructions',
         'image': 'strMealThumb',
         'sourceUrl': 'strSource',
-        'author': 'original_video_url'
+        'author': 'original_video_url',
+        # Numeric fields and diet flags under the corpus names (see numeric_index.py)
+        'readyInMinutes': 'ready_in_minutes',
+        'healthScore': 'health_score',
+        'aggregateLikes': 'likes',
+        'vegan': 'is_vegan',
+        'glutenFree': 'is_gluten_free',
+        'dairyFree': 'is_dairy_free'
     })
+    # pricePerServing is in cents
+    spoonacular_df['price_per_serving'] = spoonacular_df['pricePerServing'] / 100
 
-    spoonacular_df['ingredients'] = spoonacular_df['ingredients'].astype(str)
-    spoonacular_df['parsed_ingredients_spoonacular'] = spoonacular_df['ingredients'].apply(parse_ingredients)
-    spoonacular_df['search_ingredients'] = spoonacular_df['parsed_ingredients_spoonacular'].apply(extract_ingredients)
-    spoonacular_df['temp_parsed_instructions'] = spoonacular_df['strInstructions'].apply(parse_instructions)
+    with stage('spoonacular.parse_ingredients', rows=len(spoonacular_df)):
+        spoonacular_df['ingredients'] = spoonacular_df['ingredients'].astype(str)
+        spoonacular_df['parsed_ingredients_spoonacular'] = spoonacular_df['ingredients'].apply(parse_ingredients)
+        spoonacular_df['search_ingredients'] = spoonacular_df['parsed_ingredients_spoonacular'].apply(extract_ingredients)
+    with stage('spoonacular.parse_instructions', rows=len(spoonacular_df)):
+        spoonacular_df['temp_parsed_instructions'] = map_rows(parse_instructions, spoonacular_df['strInstructions'])
     spoonacular_df['parsed_strInstructions'] = spoonacular_df['temp_parsed_instructions']
 
     def get_isolated_ingredients(ingredients_str):
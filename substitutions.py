@@ -0,0 +1,55 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+# Built-in "Common Substitutions" toggles
+DEFAULT_SUBSTITUTIONS = [
+    {'label': 'Margarine for Butter', 'pattern': 'butter', 'replacement': 'margarine'},
+    {'label': 'Applesauce for Oil', 'pattern': 'oil', 'replacement': 'applesauce'},
+    {'label': 'Greek Yogurt for Sour Cream', 'pattern': 'sour cream', 'replacement': 'greek yogurt'},
+    {'label': 'Honey for Sugar', 'pattern': 'sugar', 'replacement': 'honey'},
+]
+
+# Optional user-defined rules, a JSON list of {"label", "pattern", "replacement"} objects
+SUBSTITUTIONS_FILE = 'substitutions.json'
+
+
+def load_substitutions(base_dir):
+    """Built-in rules followed by the user-defined ones from substitutions.json, if present."""
+    rules = list(DEFAULT_SUBSTITUTIONS)
+    path = os.path.join(base_dir, SUBSTITUTIONS_FILE)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            rules.extend(
+                {'label': rule['label'], 'pattern': rule['pattern'], 'replacement': rule['replacement']}
+                for rule in json.load(f)
+            )
+    return rules
+
+
+def substitution_key(rule):
+    return rule['label'].lower().replace(' ', '_')
+
+
+@lru_cache(maxsize=64)
+def _compile(pairs):
+    replacements = {pattern.lower(): replacement for pattern, replacement in pairs}
+    # Longest patterns first, so overlapping rules resolve to the longest match at each position
+    alternation = '|'.join(re.escape(pattern) for pattern in sorted(replacements, key=len, reverse=True))
+    regex = re.compile(alternation, re.IGNORECASE)
+    return lambda text: regex.sub(lambda match: replacements[match.group(0).lower()], text)
+
+
+def compile_substitutions(rules):
+    """Single-pass rewriter for the given rules.
+
+    Every rule's pattern is matched case-insensitively as literal text in one scan, and
+    replacement text is never rescanned, so the result does not depend on rule order.
+    Substitutions only change how ingredients are displayed: search and the dietary
+    filters always run against the original ingredient text.
+    """
+    pairs = tuple((rule['pattern'], rule['replacement']) for rule in rules if rule['pattern'])
+    if not pairs:
+        return lambda text: text
+    return _compile(pairs)
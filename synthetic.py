@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+import sys
+from meals_tab import load_meals_data
+from recipes_tab import RECIPES_COLUMNS
+from spoonacular_tab import SPOONACULAR_COLUMNS
+from ratings_store import RATINGS_DB_FILE, LEGACY_RATINGS_FILE
+
+# Columns resampled together from one template row, so they stay consistent with each other
+MEALS_GROUPS = [[f'strIngredient{i}' for i in range(1, 21)] + [f'strMeasure{i}' for i in range(1, 21)]]
+RECIPES_GROUPS = [['total_time_minutes', 'num_servings', 'price']]
+SPOONACULAR_GROUPS = [['ingredients', 'parsed_ingredients', 'vegetarian', 'vegan', 'glutenFree', 'dairyFree']]
+
+# Share of titles that get ratings, and the most ratings one title gets
+RATED_SHARE = 0.2
+MAX_RATING_COUNT = 20
+
+
+def synthetic_titles(titles, rows, seed=0):
+    """Random 2-5 word titles drawn from the words of the real titles."""
+    rng = np.random.default_rng(seed)
+    words = pd.Series(titles.dropna().str.split().explode().unique())
+    lengths = rng.integers(2, 6, size=rows)
+    picks = words.to_numpy()[rng.integers(0, len(words), size=lengths.sum())]
+    return pd.Series([' '.join(title) for title in np.split(picks, np.cumsum(lengths)[:-1])], dtype='str')
+
+
+def resample_frame(df, rows, rng, groups=()):
+    """rows new rows whose columns are drawn from independently chosen rows of df.
+
+    Every value keeps the exact shape the loaders parse (literal-encoded lists, HTML,
+    numbered strIngredientN slots), while the combinations are new. Columns in one of
+    `groups` are drawn together from the same row.
+    """
+    grouped = {column for group in groups for column in group}
+    blocks = [[column] for column in df.columns if column not in grouped]
+    blocks += [[column for column in group if column in df.columns] for group in groups]
+    columns = {}
+    for block in blocks:
+        picks = rng.integers(0, len(df), size=rows)
+        for column in block:
+            columns[column] = df[column].to_numpy()[picks]
+    return pd.DataFrame(columns, columns=df.columns)
+
+
+def synthetic_ratings(titles, rng):
+    """{title: {"total", "count"}} for a random RATED_SHARE of the titles, as in ratings.json."""
+    rated = pd.unique(titles[rng.random(len(titles)) < RATED_SHARE])
+    counts = rng.integers(1, MAX_RATING_COUNT + 1, size=len(rated))
+    totals = [int(rng.integers(1, 6, size=count).sum()) for count in counts]
+    return {title: {'total': total, 'count': int(count)} for title, total, count in zip(rated, totals, counts)}
+
+
+def source_row_counts(rows, template_sizes):
+    """Split rows across the sources in the proportions of the real data."""
+    total = sum(template_sizes)
+    counts = [rows * size // total for size in template_sizes]
+    counts[-1] += rows - sum(counts)
+    return counts
+
+
+def generate_sources(base_dir, out_dir, rows, seed=0):
+    """Write meals/recipes/spoonacular Parquet files with `rows` rows in total to out_dir.
+
+    The bundled sources under base_dir are the templates; only the columns the loaders
+    read are written. Titles are new word combinations and ids are unique. A ratings.json
+    for a share of the titles is written too, and any ratings database already in
+    out_dir is removed so the store imports it afresh.
+    """
+    rng = np.random.default_rng(seed)
+    meals_df = load_meals_data(base_dir)
+    recipes_df = pd.read_parquet(os.path.join(base_dir, 'recipes.parquet'), columns=RECIPES_COLUMNS)
+    spoonacular_df = pd.read_parquet(os.path.join(base_dir, 'spoonacular.parquet'), columns=SPOONACULAR_COLUMNS)
+    meal_rows, recipe_rows, spoonacular_rows = source_row_counts(
+        rows, [len(meals_df), len(recipes_df), len(spoonacular_df)])
+
+    meals = resample_frame(meals_df, meal_rows, rng, MEALS_GROUPS)
+    meals['idMeal'] = [str(100000 + i) for i in range(meal_rows)]
+    meals['strMeal'] = synthetic_titles(meals_df['strMeal'], meal_rows, seed).to_numpy()
+
+    recipes = resample_frame(recipes_df, recipe_rows, rng, RECIPES_GROUPS)
+    recipes['id'] = np.arange(recipe_rows, dtype=np.int64)
+    recipes['name'] = synthetic_titles(recipes_df['name'], recipe_rows, seed + 1).to_numpy()
+
+    spoonacular = resample_frame(spoonacular_df, spoonacular_rows, rng, SPOONACULAR_GROUPS)
+    spoonacular['id'] = np.arange(spoonacular_rows, dtype=np.int64)
+    spoonacular['title'] = synthetic_titles(spoonacular_df['title'], spoonacular_rows, seed + 2).to_numpy()
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, df in [('meals', meals), ('recipes', recipes), ('spoonacular', spoonacular)]:
+        df.to_parquet(os.path.join(out_dir, f'{name}.parquet'), index=False)
+
+    titles = pd.concat([meals['strMeal'], recipes['name'], spoonacular['title']], ignore_index=True)
+    with open(os.path.join(out_dir, LEGACY_RATINGS_FILE), 'w') as f:
+        json.dump(synthetic_ratings(titles.to_numpy(), rng), f)
+    for suffix in ['', '-wal', '-shm']:
+        path = os.path.join(out_dir, RATINGS_DB_FILE + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+    return {'meals': meal_rows, 'recipes': recipe_rows, 'spoonacular': spoonacular_rows}
+
+
+if __name__ == '__main__':
+    # Usage: python synthetic.py rows out_dir [seed]
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    rows, out_dir = int(sys.argv[1]), sys.argv[2]
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    counts = generate_sources(base_dir, out_dir, rows, seed)
+    print(f"Wrote {', '.join(f'{count} {name}' for name, count in counts.items())} rows to {out_dir}")
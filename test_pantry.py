@@ -0,0 +1,25 @@
+import pandas as pd
+from pantry import PantryIndex, parse_pantry_items
+from similarity import SimilarityEngine
+
+
+def pantry_index():
+    df = pd.DataFrame({
+        'strMeal': ['Omelette', 'Tomato Salad', 'Pancakes'],
+        'strMealThumb': [''] * 3,
+        'isolated_ingredients': ['Egg, Butter', 'Tomatoes, Olive Oil', 'Eggs, Flour, Milk'],
+    })
+    return PantryIndex(SimilarityEngine(df))
+
+
+def satisfied(pantry_search):
+    return pantry_index().coverage(parse_pantry_items(pantry_search)).satisfied.tolist()
+
+
+def test_plural_and_singular_items_match_both_forms():
+    assert satisfied('eggs') == satisfied('egg') == [1, 0, 1]
+    assert satisfied('tomato') == satisfied('tomatoes') == [0, 1, 0]
+
+
+def test_items_are_plain_text():
+    assert satisfied('tomato(, olive oil') == [0, 1, 0]
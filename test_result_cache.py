@@ -0,0 +1,12 @@
+from result_cache import query_key
+from search_engine import SearchQuery
+
+
+def test_query_key_folds_case_of_plain_text():
+    assert query_key(SearchQuery(meal_search='CHICKEN')) == query_key(SearchQuery(meal_search='chicken'))
+
+
+def test_query_key_keeps_case_of_escapes():
+    # \S (non-space) and \s (space) match different titles
+    assert query_key(SearchQuery(meal_search=r'Chicken\S')) != query_key(SearchQuery(meal_search=r'chicken\s'))
+    assert query_key(SearchQuery(tags_search=r'\Soup')) != query_key(SearchQuery(tags_search=r'\soup'))
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import re
+
+# Queries with regex syntax are matched by `str.contains` as patterns, so they are scanned
+REGEX_SYNTAX = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+# Share of the query's trigrams a title must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.4
+
+
+def fold(text):
+    return text.casefold()
+
+
+def trigram_keys(codes):
+    """uint64 keys of the consecutive trigrams in an array of code points."""
+    codes = codes.astype(np.uint64)
+    return (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+
+
+def text_keys(text):
+    return np.unique(trigram_keys(np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)))
+
+
+class TrigramIndex:
+    """Trigram index over case-folded titles, for substring and fuzzy title search.
+
+    Each title is padded as '  ' + title + ' ' and every trigram of it is posted, so the
+    trigrams of any substring are all in the index. `search` intersects the posting lists
+    of the query's trigrams and confirms the candidates with `str.contains`, which keeps
+    its results identical to `titles.str.contains(query, case=False, na=False)`.
+    """
+
+    def __init__(self, titles):
+        self.titles = titles.reset_index(drop=True)
+        originals = self.titles.fillna('').astype(str).tolist()
+        folded = [fold(title) for title in originals]
+        # Titles whose case folding changes their length are always confirmed by a scan
+        self.unfoldable = np.array([i for i, (title, folded_title) in enumerate(zip(originals, folded))
+                                    if len(title) != len(folded_title)], dtype=np.int64)
+
+        padded = ['  ' + title + ' ' for title in folded]
+        lengths = np.array([len(title) for title in padded], dtype=np.int64)
+        codes = np.frombuffer(''.join(padded).encode('utf-32-le'), dtype=np.uint32)
+        starts = np.cumsum(lengths) - lengths
+        # Keep only trigrams that start and end inside the same title
+        rows = np.repeat(np.arange(len(padded), dtype=np.int32), lengths)[:max(len(codes) - 2, 0)]
+        valid = np.arange(len(rows)) - starts[rows] <= lengths[rows] - 3
+        keys, rows = trigram_keys(codes)[valid], rows[valid]
+
+        # Rows stay ascending within each key (stable sort); drop repeats of a trigram in a title
+        order = np.argsort(keys, kind='stable')
+        keys, rows = keys[order], rows[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])
+        keys, rows = keys[keep], rows[keep]
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+        self.keys = keys[np.r_[0, boundaries]] if len(keys) else keys
+        self.offsets = np.r_[0, boundaries, len(keys)].astype(np.int64)
+        self.rows = rows
+        self.trigram_counts = np.bincount(rows, minlength=len(padded))
+
+    def __len__(self):
+        return len(self.titles)
+
+    def extend(self, titles):
+        """A new index over this index's titles followed by `titles`.
+
+        Only the new titles are tokenized. Their rows come after every existing row, so each
+        merged posting list is the old list followed by the new one: the postings are moved
+        into place with offset arithmetic, without sorting them again.
+        """
+        added = TrigramIndex(titles)
+        start = len(self)
+        keys = np.union1d(self.keys, added.keys)
+        old_counts, added_counts = np.diff(self.offsets), np.diff(added.offsets)
+        old_slots, added_slots = np.searchsorted(keys, self.keys), np.searchsorted(keys, added.keys)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        counts[old_slots] = old_counts
+        merged_old = counts.copy()
+        counts[added_slots] += added_counts
+        offsets = np.r_[0, np.cumsum(counts)].astype(np.int64)
+
+        rows = np.empty(offsets[-1], dtype=np.int32)
+        rows[np.repeat(offsets[old_slots] - self.offsets[:-1], old_counts) + np.arange(len(self.rows))] = self.rows
+        added_starts = offsets[added_slots] + merged_old[added_slots] - added.offsets[:-1]
+        rows[np.repeat(added_starts, added_counts) + np.arange(len(added.rows))] = added.rows + start
+
+        index = TrigramIndex.__new__(TrigramIndex)
+        index.titles = pd.concat([self.titles, added.titles], ignore_index=True)
+        index.unfoldable = np.concatenate([self.unfoldable, added.unfoldable + start])
+        index.keys, index.offsets, index.rows = keys, offsets, rows
+        index.trigram_counts = np.concatenate([self.trigram_counts, added.trigram_counts])
+        return index
+
+    def postings(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.rows[:0]
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def candidates(self, query):
+        """Sorted positions that may contain query, or None when the index cannot narrow it down.
+
+        That is the case for regex syntax, fewer than three characters, or a query whose
+        case folding changes its length.
+        """
+        folded = fold(query)
+        if REGEX_SYNTAX.search(query) or len(folded) < 3 or len(folded) != len(query):
+            return None
+        rows = None
+        # Intersect the shortest posting lists first
+        for posting in sorted((self.postings(key) for key in text_keys(folded)), key=len):
+            rows = posting if rows is None else np.intersect1d(rows, posting, assume_unique=True)
+            if not len(rows):
+                break
+        return np.union1d(rows.astype(np.int64), self.unfoldable)
+
+    def scan(self, query, positions=None):
+        titles = self.titles if positions is None else self.titles.iloc[positions]
+        mask = titles.str.contains(query, case=False, na=False).to_numpy(dtype=bool)
+        return np.flatnonzero(mask) if positions is None else np.asarray(positions)[mask]
+
+    def search(self, query):
+        """Positions of the titles matching `str.contains(query, case=False)`, in ascending order."""
+        candidates = self.candidates(query)
+        return self.scan(query, candidates)
+
+    def fuzzy(self, query, limit=None, threshold=FUZZY_THRESHOLD):
+        """Titles sharing most of the query's trigrams, best first, as (positions, scores).
+
+        The score is the share of the query's trigrams found in the title; ties go to the
+        title with fewer other trigrams, then to the earlier position.
+        """
+        query_keys = text_keys(' ' + fold(query.strip()) + ' ')
+        if not len(query_keys) or not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        shared = np.bincount(np.concatenate([self.postings(key) for key in query_keys]), minlength=len(self))
+        scores = shared / len(query_keys)
+        positions = np.flatnonzero(scores >= threshold)
+        order = np.lexsort((positions, self.trigram_counts[positions], -scores[positions]))
+        positions = positions[order][:limit]
+        return positions, scores[positions]
@@ -2,7 +2,13 @@ import streamlit as st
 import pandas as pd
 import re
 import ast
+import tempfile
 from bs4 import BeautifulSoup
+from substitutions import DEFAULT_SUBSTITUTIONS, substitution_key
+from facets import AREAS
+from pantry import DEFAULT_MAX_MISSING
+from numeric_index import DIET_COLUMNS, READY_IN_OPTIONS
+from export import EXPORT_FORMATS
 
 def get_combined_categories(recipes_df, meals_df):
     # Define the refined categories
@@ -13,29 +19,61 @@ def get_combined_categories(recipes_df, meals_df):
     ]
     return sorted(refined_categories)
 
-def search_bar(df, categories, prefix=''):
-    # Determine the column names for meal titles and tags
-    meal_column = 'strMeal' if 'strMeal' in df.columns else 'name'
-    tags_column = 'strTags' if 'strTags' in df.columns else 'tags'
-    dish_types_column = 'parsed_dish_types' if 'parsed_dish_types' in df.columns else None
+# Number inputs of range_bar: (key, numeric column, end of its range (0 low, 1 high), label, step)
+RANGE_INPUTS = [
+    ('min_servings', 'servings', 0, 'Serves at least:', 1),
+    ('max_servings', 'servings', 1, 'Serves at most:', 1),
+    ('max_price_per_serving', 'price_per_serving', 1, 'Max price per serving ($):', 0.5),
+    ('min_health_score', 'health_score', 0, 'Min health score:', 5),
+    ('min_likes', 'likes', 0, 'Min likes:', 10),
+]
+
+def current_search(prefix=''):
+    """The search_bar values of this run as SearchQuery fields, read from session state before the widgets are drawn."""
+    state = st.session_state
+    ranges, diets = range_filters(prefix)
+    return {
+        'meal_search': state.get(f'{prefix}meal_search') or '',
+        'category_search': state.get(f'{prefix}category_search') or '',
+        'area_search': state.get(f'{prefix}area_search') or '',
+        'tags_search': state.get(f'{prefix}tags_search') or '',
+        'ingredients_search': state.get(f'{prefix}ingredients_search') or '',
+        'min_star_rating': state.get(f'{prefix}min_star_rating') or '',
+        'vegetarian_filter': bool(state.get(f'{prefix}vegetarian_filter')),
+        'kosher_filter': bool(state.get(f'{prefix}kosher_filter')),
+        'num_ingredients': state.get(f'{prefix}num_ingredients') or '',
+        'pantry_search': state.get(f'{prefix}pantry_search') or '',
+        'max_missing': state.get(f'{prefix}max_missing', DEFAULT_MAX_MISSING),
+        'ranges': ranges,
+        'diets': diets,
+    }
+
+def facet_options(options, counts, selected):
+    """Options that would return results (always keeping the selected one); all of them without counts."""
+    if counts is None:
+        return list(options)
+    return [option for option in options if counts.get(option) or option == selected]
+
+def facet_label(counts):
+    if counts is None:
+        return str
+    return lambda option: f'{option} ({counts.get(option, 0)})' if option else option
+
+def search_bar(df, categories, prefix='', substitutions=None, facet_counts=None):
+    # Per-option result counts under the other filters (see SearchEngine.facet_counts), when given
+    category_counts = facet_counts['category'] if facet_counts else None
+    area_counts = facet_counts['area'] if facet_counts else None
 
     # Create two columns for the first row of inputs
     col1, col2, col3 = st.columns(3)
     with col1:
         meal_search = st.text_input('Search by Meal:', key=f'{prefix}meal_search')
-        if meal_search:
-            df = df[df[meal_column].str.contains(meal_search, case=False, na=False)]
     with col2:
-        category_search = st.selectbox('Search by Category:', options=[''] + sorted(categories), index=0, key=f'{prefix}category_search')
-        if category_search:
-            category_search = category_search.replace('Snacks', 'Snacks?')
-            df = df[df[tags_column].str.contains(category_search, case=False, na=False)]
+        category_options = facet_options(sorted(categories), category_counts, st.session_state.get(f'{prefix}category_search'))
+        category_search = st.selectbox('Search by Category:', options=[''] + category_options, index=0, format_func=facet_label(category_counts), key=f'{prefix}category_search')
     with col3:
-        area_search = st.selectbox('Search by Region:', options=[''] + sorted([
-            'American', 'British', 'Canadian', 'Chinese', 'Croatian', 'Dutch', 'Egyptian', 'Filipino', 'French', 'Greek',
-            'Indian', 'Irish', 'Italian', 'Jamaican', 'Japanese', 'Kenyan', 'Malaysian', 'Mexican', 'Moroccan', 'Polish',
-            'Portuguese', 'Russian', 'Spanish', 'Thai', 'Tunisian', 'Turkish', 'Ukrainian', 'Unknown', 'Vietnamese'
-        ]), index=0, key=f'{prefix}area_search')
+        area_options = facet_options(sorted(AREAS), area_counts, st.session_state.get(f'{prefix}area_search'))
+        area_search = st.selectbox('Search by Region:', options=[''] + area_options, index=0, format_func=facet_label(area_counts), key=f'{prefix}area_search')
 
     # Create two columns for the second row of text inputs
     col4, col5, col6 = st.columns(3)
@@ -58,23 +96,125 @@ def search_bar(df, categories, prefix=''):
     # Create columns for checkboxes with thinner width
     col7, col8 = st.columns([1, 1])
     with col7:
-        vegetarian_filter = st.checkbox('Vegetarian', key=f'{prefix}vegetarian_filter')
+        vegetarian_label = f"Vegetarian ({facet_counts['vegetarian']})" if facet_counts else 'Vegetarian'
+        vegetarian_filter = st.checkbox(vegetarian_label, key=f'{prefix}vegetarian_filter')
     with col8:
-        kosher_filter = st.checkbox('Kosher', key=f'{prefix}kosher_filter')
+        kosher_label = f"Kosher ({facet_counts['kosher']})" if facet_counts else 'Kosher'
+        kosher_filter = st.checkbox(kosher_label, key=f'{prefix}kosher_filter')
 
     # Add a section for common substitutions
     with st.expander("Common Substitutions"):
-        margarine_for_butter = st.toggle('Margarine for Butter', key=f'{prefix}margarine_for_butter')
-        applesauce_for_oil = st.toggle('Applesauce for Oil', key=f'{prefix}applesauce_for_oil')
-        greek_yogurt_for_sour_cream = st.toggle('Greek Yogurt for Sour Cream', key=f'{prefix}greek_yogurt_for_sour_cream')
-        honey_for_sugar = st.toggle('Honey for Sugar', key=f'{prefix}honey_for_sugar')
+        st.caption('Substitutions change how ingredients are displayed. Search and filters use the original recipe.')
+        active_substitutions = [
+            rule for rule in (substitutions or DEFAULT_SUBSTITUTIONS)
+            if st.toggle(rule['label'], key=f'{prefix}{substitution_key(rule)}')
+        ]
 
     # Add a selectbox for the number of ingredients
     ingredient_options = ['', 'Fewer (0-5)', 'Moderate (0-10)', 'More (0-100)']
     num_ingredients = st.selectbox('Number of Ingredients:', options=ingredient_options, index=0, key=f'{prefix}num_ingredients')
 
     # Return all search and filter values
-    return meal_search, category_search, area_search, tags_search, ingredients_search, min_star_rating, vegetarian_filter, kosher_filter, margarine_for_butter, applesauce_for_oil, greek_yogurt_for_sour_cream, honey_for_sugar, num_ingredients
+    return meal_search, category_search, area_search, tags_search, ingredients_search, min_star_rating, vegetarian_filter, kosher_filter, active_substitutions, num_ingredients
+
+def pantry_bar(prefix=''):
+    """Render the "cook with what I have" inputs and return (pantry_search, max_missing)."""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        pantry_search = st.text_input('Cook with what I have:', key=f'{prefix}pantry_search',
+                                      placeholder='e.g. eggs, flour, milk, butter')
+    with col2:
+        max_missing = st.number_input('Missing allowed:', min_value=0, max_value=20, value=DEFAULT_MAX_MISSING,
+                                      step=1, key=f'{prefix}max_missing')
+    return pantry_search, int(max_missing)
+
+def range_filters(prefix=''):
+    """The range_bar values in session state as SearchQuery (ranges, diets)."""
+    state = st.session_state
+    bounds = {}
+    ready_in = state.get(f'{prefix}ready_in')
+    if ready_in in READY_IN_OPTIONS:
+        bounds['ready_in_minutes'] = [None, READY_IN_OPTIONS[ready_in]]
+    for key, column, end, _, _ in RANGE_INPUTS:
+        value = state.get(f'{prefix}{key}')
+        if value is not None:
+            bounds.setdefault(column, [None, None])[end] = value
+    ranges = tuple((column, low, high) for column, (low, high) in bounds.items())
+    diets = tuple(column for column in DIET_COLUMNS if state.get(f'{prefix}{column}'))
+    return ranges, diets
+
+def recipe_facts(row):
+    """'Ready in 25 min · Serves 4 · $2.50 per serving', with only the fields the row's source has."""
+    facts = []
+    if pd.notna(row['ready_in_minutes']):
+        facts.append(f"Ready in {row['ready_in_minutes']:.0f} min")
+    if pd.notna(row['servings']):
+        facts.append(f"Serves {row['servings']:.0f}")
+    if pd.notna(row['price_per_serving']):
+        facts.append(f"${row['price_per_serving']:.2f} per serving")
+    if pd.notna(row['health_score']):
+        facts.append(f"Health score {row['health_score']:.0f}")
+    return ' · '.join(facts)
+
+def range_bar(prefix=''):
+    """Render the time, servings, price, health score, likes and diet filters and return (ranges, diets)."""
+    with st.expander("More Filters"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.selectbox('Ready in:', options=[''] + list(READY_IN_OPTIONS), index=0, key=f'{prefix}ready_in')
+        # Empty inputs leave that end of the range open
+        for col, (key, _, _, label, step) in zip([col2, col3, col1, col2, col3], RANGE_INPUTS):
+            with col:
+                st.number_input(label, min_value=type(step)(0), value=None, step=step, key=f'{prefix}{key}')
+        for col, (column, label) in zip(st.columns(len(DIET_COLUMNS)), DIET_COLUMNS.items()):
+            with col:
+                st.checkbox(label, key=f'{prefix}{column}')
+    return range_filters(prefix)
+
+def export_controls(result, prefix=''):
+    """Render a download button for every match of result (not just the page shown) in a chosen format."""
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        export_format = st.selectbox('Export format:', options=list(EXPORT_FORMATS), index=0, key=f'{prefix}export_format')
+
+    # Runs only once the button is clicked; the rows are streamed to a temporary file in batches
+    def export_data():
+        with tempfile.TemporaryFile() as f:
+            result.export(f, export_format)
+            f.seek(0)
+            return f.read()
+
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.download_button(f'Download {result.total} results', data=export_data, file_name=f'recipes.{export_format}',
+                           mime=EXPORT_FORMATS[export_format], on_click='ignore', key=f'{prefix}export')
+
+def pagination_controls(total, prefix='', page_sizes=(10, 25, 50, 100)):
+    """Render page size and page number controls and return the (start, stop) row range to display."""
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        page_size = st.selectbox('Results per page:', options=list(page_sizes), index=1, key=f'{prefix}page_size')
+    pages = max(1, -(-total // page_size))
+    # Go back to the first page when the results no longer reach the selected one
+    page_key = f'{prefix}page'
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = 1
+    with col2:
+        page = st.number_input('Page:', min_value=1, max_value=pages, step=1, key=page_key)
+    start = (page - 1) * page_size
+    stop = min(start + page_size, total)
+    with col3:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if total:
+            st.write(f"Showing {start + 1}-{stop} of {total} recipes")
+        else:
+            st.write("No recipes match the search criteria.")
+    return start, stop
+
+def map_rows(func, values):
+    """Apply func to each value in order; the loaders' per-row parsing runs through this or a parallel equivalent."""
+    return [func(value) for value in values]
+
 def parse_extended_ingredients(extended_ingredients_str):
     """Parse the extendedIngredients column to extract ingredients and measurements."""
     try: